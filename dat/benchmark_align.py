@@ -0,0 +1,33 @@
+# -------------------------------------
+# Compare the speed of the vectorized alignment of the sets with the loop
+# of synchronized_loop on a large generated set.
+# Launch from the root directory:  python dat/benchmark_align.py [rows]
+# -------------------------------------
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath('.'))
+from lib.setsManagement import synchronized_sets, synchronized_loop, default_choices
+
+def timed(function, *args):
+    '''Return the result and the duration of a call in seconds'''
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(0)
+    times = 1_600_000_000_000_000_000 + 1_000_000_000 * np.arange(rows, dtype=np.int64)
+    sets = {'a': (times, np.round(rng.normal(0, 1, rows), 3))}
+    for step in ('3s', '700ms'):
+        choice = dict(default_choices, step=step)
+        table, t_vec = timed(synchronized_sets, sets, choice)
+        reference, t_loop = timed(synchronized_loop, sets, choice)
+        same = table.equals(reference.astype(np.float64))
+        print(f'{rows} rows, step {step}: synchronized_loop {t_loop:.2f}s, '
+              f'synchronized_sets {t_vec:.3f}s, speed-up x{t_loop/t_vec:.0f}, '
+              f'same table: {same}')
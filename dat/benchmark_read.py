@@ -0,0 +1,67 @@
+
+# -------------------------------------
+# Compare the speed of the readers on a large generated file,
+# and time the check of the steps of millions of rows.
+# Launch from the root directory:  python dat/benchmark_read.py [rows]
+# -------------------------------------
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath('.'))
+from lib.setsManagement import read_measures
+from lib.setsReader import read_measures_arrays, read_measures_parallel, reader_settings
+from lib.setsSteps import step_report
+
+def write_sets(file_name, rows_per_set, with_ms=False, copies=1):
+    '''Write three sets (times copies) in the format of dat/data.csv'''
+    titles = [f'LBA{10+i}{kind}001' for i in range(copies) for kind in ('CT', 'CP', 'CF')]
+    steps_ms = copies * ([4500, 2250, 2250] if with_ms else [5000, 2000, 3000])
+    unit = 'ms' if with_ms else 's'
+    start = np.datetime64('2023-10-07T08:00:00.000')
+    with open(file_name, 'w') as csv_file:
+        for title, step in zip(titles, steps_ms):
+            times = start + np.arange(rows_per_set) * np.timedelta64(step, 'ms')
+            dates = np.char.replace(np.datetime_as_string(times, unit=unit), 'T', ' ')
+            values = np.round(np.random.uniform(10.0, 150.0, rows_per_set), 2)
+            csv_file.write(f'{title}\n')
+            csv_file.writelines(f'{d},{v}\n' for d, v in zip(dates.tolist(), values.tolist()))
+
+def timed(function, *args):
+    '''Return the duration of a call in seconds'''
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as directory:
+        for with_ms in (False, True):
+            file_name = os.path.join(directory, 'bench.csv')
+            write_sets(file_name, rows, with_ms)
+            t_ref = timed(read_measures, file_name)
+            t_vec = timed(read_measures_arrays, file_name)
+            print(f'{3*rows} rows, ms={with_ms}: read_measures {t_ref:.2f}s, '
+                  f'read_measures_arrays {t_vec:.2f}s, speed-up x{t_ref/t_vec:.1f}')
+
+        # scaling of the parallel parsing on a file of 24 sets
+        file_name = os.path.join(directory, 'bench_sets.csv')
+        write_sets(file_name, rows, with_ms=True, copies=8)
+        t_one = timed(read_measures_arrays, file_name)
+        print(f'{24*rows} rows in 24 sets: read_measures_arrays {t_one:.2f}s')
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            settings = dict(reader_settings, workers=workers)
+            t_par = timed(read_measures_parallel, file_name, settings)
+            print(f'  read_measures_parallel, {workers} workers: {t_par:.2f}s, '
+                  f'speed-up x{t_one/t_par:.1f}')
+            workers *= 2
+
+    # exact check of all the steps of a set with a gap
+    times = np.arange(25 * rows, dtype=np.int64) * 1_000_000
+    times[len(times) // 2:] += 5_000_000
+    print(f'{len(times)} steps checked by step_report in '
+          f'{timed(step_report, "x", times) * 1000:.0f}ms')
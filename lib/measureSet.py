@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+"""
+Compact structures holding the sets of measures.
+
+The sets read by ``setsReader`` are couples of arrays (times, values), the
+times being int64 nanoseconds since the epoch. A ``MeasureSet`` keeps these
+two arrays with the name of the set, its time step and the format of its
+date-times, about 16 bytes per measure instead of about 150 for a tuple
+(datetime, value). When the time step of a set is constant, its times are
+fully given by the first time and the step, so the set can be kept as a
+``RegularSeries``.
+"""
+
+
+# precisions of the stored values: float64 as read, float32, or int32 of
+# the values multiplied by 10**decimals, decimals being chosen per set
+PRECISIONS = ('float64', 'float32', 'scaled')
+
+# dtype of the values stored with each precision
+_PRECISION_DTYPES = {'float64': np.float64, 'float32': np.float32, 'scaled': np.int32}
+
+# int32 standing for NaN in the scaled values
+_NAN_INT32 = np.iinfo(np.int32).min
+
+
+def value_decimals(values: np.ndarray, max_decimals: int = 6) -> int:
+    """
+    Smallest number of decimals, up to ``max_decimals``, with which all the
+    values are given back exactly, or None.
+    """
+    finite = values[np.isfinite(values)]
+    for decimals in range(max_decimals + 1):
+        if (np.round(finite * 10.0**decimals) / 10.0**decimals == finite).all():
+            return decimals
+    return None
+
+
+def pack_values(values: np.ndarray, precision: str = 'float64',
+                max_decimals: int = 6) -> tuple:
+    """
+    Store float64 values with one of the ``PRECISIONS``, and return the
+    stored array with the decimals needed to give back the values. A set
+    which cannot be stored without loss is kept in float64.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    if precision not in PRECISIONS:
+        raise ValueError(f'Precision {precision} not in {PRECISIONS}.')
+    decimals = None if precision == 'float64' else value_decimals(values, max_decimals)
+    if decimals is None:
+        return values, None
+    if precision == 'float32':
+        packed = values.astype(np.float32)
+        if not np.array_equal(unpack_values(packed, decimals), values, equal_nan=True):
+            return values, None
+        return packed, decimals
+    scaled = np.round(values * 10.0**decimals)
+    missing = np.isnan(values)
+    if np.abs(scaled[~missing]).max(initial=0.0) >= -_NAN_INT32:
+        return values, None
+    return np.where(missing, _NAN_INT32, scaled).astype(np.int32), decimals
+
+
+def unpack_values(packed: np.ndarray, decimals: int = None) -> np.ndarray:
+    """
+    Give back the float64 values stored by ``pack_values``, the values kept
+    in float64 being returned without copy.
+    """
+    if packed.dtype == np.float64:
+        return packed
+    if packed.dtype == np.float32:
+        values = packed.astype(np.float64)
+        return values if decimals is None else np.round(values, decimals)
+    values = packed / 10.0**decimals
+    values[packed == _NAN_INT32] = np.nan
+    return values
+
+
+class MeasureSet:
+    """
+    Set of measures held in two contiguous arrays: the times in int64
+    nanoseconds since the epoch and the values, stored in float64 or with
+    a smaller ``precision`` (see ``pack_values``). ``step`` is the time
+    step in nanoseconds when it is constant, else None.
+
+    ``len`` gives the number of measures, an index gives the couple
+    (time, value) and a slice gives a ``MeasureSet`` sharing the arrays.
+    ``numpy.asarray`` gives the values, without copy when stored in float64.
+    """
+    __slots__ = ('name', 'times', 'packed', 'decimals', 'step', 'datetime_format')
+
+    def __init__(self, name: str, times: np.ndarray, values: np.ndarray,
+                 step: int = None, datetime_format: str = None,
+                 precision: str = 'float64'):
+        if len(times) != len(values):
+            raise ValueError(f'Set {name} has {len(times)} times '
+                             f'for {len(values)} values.')
+        self.name = name
+        self.times = np.ascontiguousarray(times, dtype=np.int64)
+        self.packed, self.decimals = pack_values(values, precision)
+        self.step = None if step is None else int(step)
+        self.datetime_format = datetime_format
+
+    @classmethod
+    def from_arrays(cls, name: str, times: np.ndarray, values: np.ndarray,
+                    datetime_format: str = None, precision: str = 'float64'):
+        """Measure set of the arrays, its time step being detected."""
+        steps = np.diff(times)
+        step = None
+        if len(steps) and steps[0] > 0 and (steps == steps[0]).all():
+            step = steps[0]
+        return cls(name, times, values, step, datetime_format, precision)
+
+    @classmethod
+    def from_packed(cls, name: str, times: np.ndarray, packed: np.ndarray,
+                    decimals: int = None, step: int = None,
+                    datetime_format: str = None):
+        """
+        Measure set of values already stored by ``pack_values``, the arrays
+        being kept without copy (they may be views on a shared buffer).
+        """
+        result = cls.__new__(cls)
+        result.name, result.times, result.packed = name, times, packed
+        result.decimals, result.step = decimals, step
+        result.datetime_format = datetime_format
+        return result
+
+    def _sliced(self, times: np.ndarray, packed: np.ndarray, step: int):
+        """Set sharing the stored values, without packing them again."""
+        return MeasureSet.from_packed(self.name, times, packed, self.decimals,
+                                      step, self.datetime_format)
+
+    @property
+    def values(self) -> np.ndarray:
+        """Values in float64."""
+        return unpack_values(self.packed, self.decimals)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the arrays of the set."""
+        return self.times.nbytes + self.packed.nbytes
+
+    def __len__(self) -> int:
+        return len(self.packed)
+
+    def __repr__(self) -> str:
+        return (f'MeasureSet(name={self.name!r}, len={len(self)}, '
+                f'step={self.step}, datetime_format={self.datetime_format!r}, '
+                f'dtype={self.packed.dtype})')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            step = self.step
+            if step is not None:
+                step *= index.indices(len(self))[2]
+                step = step if step > 0 else None
+            return self._sliced(self.times[index], self.packed[index], step)
+        value = unpack_values(self.packed[[index]], self.decimals)[0]
+        return int(self.times[index]), float(value)
+
+    def __iter__(self):
+        return zip(self.times.tolist(), self.values.tolist())
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        if copy:
+            return np.array(self.values, dtype=dtype)
+        return self.values if dtype is None else self.values.astype(dtype, copy=False)
+
+
+class RegularSeries:
+    """
+    Set of measures with a constant time step, holding only the first
+    time, the step (both in nanoseconds) and the contiguous array of the
+    values, stored with a ``precision`` as in ``MeasureSet``. The times
+    are only computed when they are asked for.
+    """
+    __slots__ = ('start', 'step', 'packed', 'decimals')
+
+    def __init__(self, start: int, step: int, values: np.ndarray,
+                 precision: str = 'float64'):
+        if step <= 0:
+            raise ValueError(f'Time step {step} of a regular series shall be positive.')
+        self.start = int(start)
+        self.step = int(step)
+        self.packed, self.decimals = pack_values(values, precision)
+
+    @classmethod
+    def from_arrays(cls, times: np.ndarray, values: np.ndarray,
+                    precision: str = 'float64'):
+        """
+        Return the regular series of the arrays (times, values) if the time
+        step is exactly constant, else None.
+        """
+        if len(times) < 2:
+            return None
+        steps = np.diff(times)
+        if steps[0] <= 0 or not (steps == steps[0]).all():
+            return None
+        return cls(times[0], steps[0], values, precision)
+
+    @classmethod
+    def from_packed(cls, start: int, step: int, packed: np.ndarray,
+                    decimals: int = None):
+        """Regular series of values already stored by ``pack_values``, without copy."""
+        result = cls.__new__(cls)
+        result.start, result.step = int(start), int(step)
+        result.packed, result.decimals = packed, decimals
+        return result
+
+    @property
+    def values(self) -> np.ndarray:
+        """Values in float64."""
+        return unpack_values(self.packed, self.decimals)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the array of the values."""
+        return self.packed.nbytes
+
+    def __len__(self) -> int:
+        return len(self.packed)
+
+    def __repr__(self) -> str:
+        return (f'RegularSeries(start={self.start}, step={self.step}, '
+                f'len={len(self)}, dtype={self.packed.dtype})')
+
+    @property
+    def end(self) -> int:
+        """Time of the last value in nanoseconds."""
+        return self.start + (len(self) - 1) * self.step
+
+    @property
+    def times(self) -> np.ndarray:
+        """Times of all the values, computed on demand."""
+        return self.start + self.step * np.arange(len(self), dtype=np.int64)
+
+    def index_of(self, times) -> np.ndarray:
+        """
+        Position of the last value at or before each time, computed
+        arithmetically (-1 before the start, len-1 after the end).
+        """
+        index = (np.asarray(times, dtype=np.int64) - self.start) // self.step
+        return np.clip(index, -1, len(self) - 1)
+
+    def at(self, times) -> np.ndarray:
+        """Values at the given times, NaN when no value is at that time."""
+        times = np.asarray(times, dtype=np.int64)
+        index = self.index_of(times)
+        exact = (index >= 0) & (self.start + index * self.step == times)
+        return np.where(exact, self.values[np.maximum(index, 0)], np.nan)
+
+
+class MeasureSets(dict):
+    """
+    Dictionary of sets keeping the characteristics computed on them by
+    ``setsManagement.sets_starts_ends_steps``, until a set is added,
+    removed or replaced. A set changed in place (a list appended to) is
+    signaled by ``invalidate``. ``formats`` gives the datetime format of
+    the sets read from a file.
+    """
+    __slots__ = ('characteristics', 'formats')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.characteristics = None
+        self.formats = {}
+
+    def invalidate(self) -> None:
+        """Forget the characteristics of the sets."""
+        self.characteristics = None
+
+    def __setitem__(self, name, entry) -> None:
+        self.characteristics = None
+        super().__setitem__(name, entry)
+
+    def __delitem__(self, name) -> None:
+        self.characteristics = None
+        super().__delitem__(name)
+
+    def __ior__(self, other):
+        self.characteristics = None
+        return super().__ior__(other)
+
+    def update(self, *args, **kwargs) -> None:
+        self.characteristics = None
+        super().update(*args, **kwargs)
+
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self.characteristics = None
+        return super().setdefault(name, default)
+
+    def pop(self, *args):
+        self.characteristics = None
+        return super().pop(*args)
+
+    def popitem(self) -> tuple:
+        self.characteristics = None
+        return super().popitem()
+
+    def clear(self) -> None:
+        self.characteristics = None
+        super().clear()
+
+
+def measure_arrays(entry) -> tuple:
+    """
+    Return the arrays (times, values) of a set given as a couple of
+    arrays, as a ``MeasureSet``, as a ``RegularSeries`` or as a list of
+    couples (datetime, value) as returned by ``setsManagement.read_measures``.
+    """
+    if isinstance(entry, (MeasureSet, RegularSeries)):
+        return entry.times, entry.values
+    if isinstance(entry, list):
+        times = np.array([t for t, _ in entry], dtype='datetime64[ns]')
+        return times.view(np.int64), np.array([v for _, v in entry], dtype=np.float64)
+    return entry
+
+
+def set_formats(data: dict) -> dict:
+    """
+    Datetime format of each set of a dictionary, when it is known: the
+    ``formats`` of the sets read from a file (see ``MeasureSets``,
+    ``setsReader.LazySets`` and ``setsStore.ChunkedStore``) and the one of
+    each ``MeasureSet``.
+    """
+    formats = {name: datetime_format
+               for name, datetime_format in getattr(data, 'formats', {}).items()
+               if datetime_format is not None}
+    for name, entry in data.items():
+        if isinstance(entry, MeasureSet) and entry.datetime_format is not None:
+            formats[name] = entry.datetime_format
+    return formats
+
+
+def measure_sets(data: dict, precision: str = 'float64',
+                 formats: dict = None) -> dict:
+    """
+    Adapter of the sets given in any of the forms of ``measure_arrays``,
+    in particular the dictionary of lists of ``read_measures``, into a
+    dictionary of ``MeasureSet`` storing their values with ``precision``.
+    A ``MeasureSet`` stored with another precision is packed again, and
+    kept as it is when ``precision`` is None (the other sets in float64).
+
+    The datetime format of each set is taken from ``formats``, else from
+    ``set_formats``.
+    """
+    formats = {**set_formats(data), **(formats or {})}
+    result = MeasureSets()
+    for name, entry in data.items():
+        datetime_format = formats.get(name)
+        if isinstance(entry, MeasureSet):
+            if precision is not None and entry.packed.dtype != _PRECISION_DTYPES[precision]:
+                result[name] = MeasureSet(name, entry.times, entry.values, entry.step,
+                                          datetime_format, precision)
+            elif entry.datetime_format != datetime_format:
+                result[name] = MeasureSet.from_packed(name, entry.times, entry.packed,
+                                                      entry.decimals, entry.step,
+                                                      datetime_format)
+            else:
+                result[name] = entry
+        elif isinstance(entry, RegularSeries):
+            if precision is None or entry.packed.dtype == _PRECISION_DTYPES[precision]:
+                result[name] = MeasureSet.from_packed(name, entry.times, entry.packed,
+                                                      entry.decimals, entry.step,
+                                                      datetime_format)
+            else:
+                result[name] = MeasureSet(name, entry.times, entry.values, entry.step,
+                                          datetime_format, precision)
+        else:
+            result[name] = MeasureSet.from_arrays(name, *measure_arrays(entry),
+                                                  datetime_format, precision or 'float64')
+    result.formats = {name: f for name, f in formats.items() if name in result}
+    return result
+
+
+def regularize(data: dict) -> dict:
+    """
+    Keep as ``RegularSeries`` the sets of a dictionary whose time step is
+    exactly constant, the other sets are kept as they are. The values of a
+    ``MeasureSet`` are kept with their precision, only its times being
+    dropped. The datetime formats of the sets are kept in ``formats``.
+    """
+    result = MeasureSets()
+    result.formats = set_formats(data)
+    for name, entry in data.items():
+        if isinstance(entry, MeasureSet):
+            if entry.step is not None:
+                entry = RegularSeries.from_packed(entry.times[0], entry.step,
+                                                  entry.packed, entry.decimals)
+        elif not isinstance(entry, RegularSeries):
+            entry = RegularSeries.from_arrays(*measure_arrays(entry)) or entry
+        result[name] = entry
+    return result
@@ -105,6 +105,7 @@ from matplotlib.backends.backend_tkagg import (
     NavigationToolbar2Tk
 )
 import matplotlib.dates as mdates
+from lib.measureSet import measure_arrays
 # -------------------------------------------------------------------------------
 plot_settings = {
     'width': 2000,
@@ -146,9 +147,9 @@ def display_source_plot(root, datasets: dict, title='Graphs', settings=plot_sett
     # key = list(datasets.keys())[0]  # to get a single element
     line = {}
     for key in datasets.keys():
-        datX = [x[0] for x in datasets[key]]
-        datY = [x[1] for x in datasets[key]]
-        line[key], = axes.plot(datX, datY, label=key)
+        # any form of set, the arrays are plotted without building tuples
+        times, values = measure_arrays(datasets[key])
+        line[key], = axes.plot(times.view('datetime64[ns]'), values, label=key)
 
     axes.set_ylim(*settings['ylim'])
     axes.tick_params(axis='both', labelsize=settings['labelsize'])
@@ -216,9 +217,9 @@ def plot_compare(root, datasets:dict, table: pd.DataFrame, title='Graphs', setti
     
     line = {}
     for key in datasets.keys():
-        datX = [x[0] for x in datasets[key]]
-        datY = [x[1] for x in datasets[key]]
-        line[key], = axes.plot(datX, datY, label=key)
+        # any form of set, the arrays are plotted without building tuples
+        times, values = measure_arrays(datasets[key])
+        line[key], = axes.plot(times.view('datetime64[ns]'), values, label=key)
     
     for colTitle in table.columns:
         axes.plot(table[colTitle], label=f'{colTitle} synchronized')
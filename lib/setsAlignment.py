@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+from lib.measureSet import RegularSeries, measure_arrays
+from lib.setsSteps import SegmentIndex, set_segments
+
+"""
+Vectorized alignment of the sets on the time grid of the table.
+
+The rows of each set are assigned to the intervals [tick, tick + step) of
+the grid with ``numpy.searchsorted`` on the int64 times, or arithmetically
+in the ``setsSteps.SegmentIndex`` of a set with a constant step, the
+values of an interval are summed at once with ``numpy.add.reduceat``, and the empty
+intervals are filled by interpolation on whole arrays, without any Python
+loop on the rows or on the ticks.
+
+The result is the one of the loop of ``setsManagement.synchronized_loop``:
+- the tick of an interval takes the mean of its values, rounded to 4
+  decimals ;
+- an empty interval takes the linear interpolation at its tick between the
+  row before and the row after the next one ;
+- the last row of a set is not used, and the ticks from the interval
+  reaching it, or after the end, are left empty (NaN).
+
+The rounding of Python's ``round`` is exact on the decimal value, when
+``numpy.round`` multiplies by 10**4 first. Both agree but near the half of
+the last decimal, where the few values are rounded with Python.
+
+The value of an interval is given by a reducer of the registry
+``reducers``, chosen by its name in ``synchro_choice['reducer']``. A
+reducer computes the values of all the non-empty intervals of a set at
+once, from the values of the set and the arrays of the first and last
+(excluded) rows of the intervals; other reducers are added with
+``register_reducer``. The empty intervals are interpolated with the mode
+of ``synchro_choice['interpolation']`` of the registry ``interpolations``.
+"""
+
+_DECIMALS = 4
+_EPSILON = np.finfo(np.float64).eps
+
+
+def grid_ticks(start: int, end: int, step: int) -> np.ndarray:
+    """Ticks of the grid in int64 nanoseconds, from start and before end."""
+    return start + step * np.arange((end - start) // step, dtype=np.int64)
+
+
+def round_values(values: np.ndarray, tolerance: np.ndarray = 0.0,
+                 exact=None) -> np.ndarray:
+    """
+    Round to 4 decimals as Python's ``round``. The values whose scaled
+    fraction is within ``tolerance`` (in units of the last decimal) of one
+    half are given by ``exact(positions)``, or by Python's ``round`` on
+    the values themselves.
+    """
+    scale = 10.0 ** _DECIMALS
+    scaled = values * scale
+    result = np.round(scaled) / scale
+    fraction = scaled - np.floor(scaled)
+    margin = np.abs(scaled) * 2 * _EPSILON + tolerance
+    doubtful = np.flatnonzero((np.abs(fraction - 0.5) <= margin)
+                              | (np.abs(scaled) >= 2.0 ** 52))
+    if len(doubtful):
+        if exact is None:
+            result[doubtful] = [round(v, _DECIMALS) for v in values[doubtful].tolist()]
+        else:
+            result[doubtful] = exact(doubtful)
+    return result
+
+
+def interval_rows(times: np.ndarray, ticks: np.ndarray, step: int, end: int,
+                  locate=None) -> tuple:
+    """
+    Rows of a set in each interval of the grid, as the arrays ``first``
+    and ``last`` (excluded), and the mask of the ticks computed: from
+    the first tick while the first row of the interval is not the last
+    row of the set and not after the end. ``locate`` gives the row of the
+    last time at or before each time, computed arithmetically for a set
+    with regular runs (``setsSteps.SegmentIndex.locate``), by default
+    found by a search in the times.
+    """
+    if locate is None:
+        def locate(at):
+            return np.searchsorted(times, at, side='right') - 1
+    first = locate(ticks - 1) + 1
+    last = np.minimum(locate(ticks + step - 1) + 1, len(times) - 1)
+    computed = first < len(times) - 1
+    computed &= first <= locate(np.array([end], dtype=np.int64))[0]
+    computed = np.logical_and.accumulate(computed)
+    return first, np.maximum(last, first), computed
+
+
+def interval_means(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> tuple:
+    """
+    Means of the values of the non-empty intervals [first, last), summed
+    with ``numpy.add.reduceat``, with the bound of their error.
+    """
+    counts = last - first
+    sums = np.add.reduceat(values[:last[-1]], first) if len(first) else values[:0]
+    largest = np.maximum.reduceat(np.abs(values[:last[-1]]), first) if len(first) else sums
+    means = sums / counts
+    # error of a sum of n values in any order, for the exact rounding
+    tolerance = 10.0 ** _DECIMALS * (2 * counts + 4) * _EPSILON * largest
+    return means, tolerance
+
+
+def reduce_mean(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Mean of the values of each interval, rounded exactly as the loop."""
+    means, tolerance = interval_means(values, first, last)
+    return round_values(
+        means, tolerance,
+        lambda doubtful: [round(sum(values[a:b].tolist()) / (b - a), _DECIMALS)
+                          for a, b in zip(first[doubtful].tolist(),
+                                          last[doubtful].tolist())])
+
+
+def reduce_min(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Smallest value of each interval."""
+    return np.minimum.reduceat(values[:last[-1]], first)
+
+
+def reduce_max(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Largest value of each interval."""
+    return np.maximum.reduceat(values[:last[-1]], first)
+
+
+def reduce_first(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """First value of each interval."""
+    return values[first]
+
+
+def reduce_last(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Last value of each interval."""
+    return values[last - 1]
+
+
+def reduce_median(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """
+    Median of the values of each interval, the values being sorted inside
+    their interval by a single ``numpy.lexsort``.
+    """
+    counts = last - first
+    interval = np.repeat(np.arange(len(first)), counts)
+    window = values[first[0]:last[-1]]
+    ordered = window[np.lexsort((window, interval))]
+    starts = first - first[0]
+    lower = ordered[starts + (counts - 1) // 2]
+    upper = ordered[starts + counts // 2]
+    result = (lower + upper) / 2
+    # a NaN is sorted last in its interval, the median is then NaN
+    result[np.isnan(ordered[starts + counts - 1])] = np.nan
+    return result
+
+
+def reduce_sum(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Sum of the values of each interval."""
+    return np.add.reduceat(values[:last[-1]], first)
+
+
+def reduce_count(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Number of values of each interval which are not NaN."""
+    present = (~np.isnan(values[:last[-1]])).astype(np.float64)
+    return np.add.reduceat(present, first)
+
+
+def reduce_std(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Standard deviation of the values of each interval (population)."""
+    counts = last - first
+    means = np.add.reduceat(values[:last[-1]], first) / counts
+    deviations = values[first[0]:last[-1]] - np.repeat(means, counts)
+    return np.sqrt(np.add.reduceat(deviations ** 2, first - first[0]) / counts)
+
+
+def reduce_range(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Difference between the largest and the smallest value of each interval."""
+    return reduce_max(values, first, last) - reduce_min(values, first, last)
+
+
+reducers = {
+    'mean': reduce_mean,
+    'min': reduce_min,
+    'max': reduce_max,
+    'first': reduce_first,
+    'last': reduce_last,
+    'median': reduce_median,
+    'sum': reduce_sum,
+    'count': reduce_count,
+    'std': reduce_std,
+    'range': reduce_range,
+}
+
+
+def register_reducer(name: str, reducer) -> None:
+    """
+    Add a reducer to the registry, or replace one. It is called as
+    ``reducer(values, first, last)`` with the float64 values of a set and
+    the int64 arrays of the first and last (excluded) rows of its
+    non-empty intervals, which follow each other, and returns the array
+    of the values of these intervals.
+    """
+    reducers[name] = reducer
+
+
+def get_reducer(name: str):
+    """Reducer of the registry with this name."""
+    if name not in reducers:
+        raise ValueError(f'Reducer {name} not in {list(reducers)}.')
+    return reducers[name]
+
+
+def interpolate_linear(times: np.ndarray, values: np.ndarray, ticks: np.ndarray,
+                       rows: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation at each tick between the row before it and the
+    row after the next one, as the loop: the product of a ``Timedelta`` by
+    a float being truncated to the nanosecond.
+    """
+    before, after = rows - 1, rows + 1
+    elapsed = (ticks - times[before]).astype(np.float64)
+    with np.errstate(invalid='ignore'):
+        product = np.trunc(elapsed * (values[after] - values[before]))
+    return values[before] + product / (times[after] - times[before])
+
+
+def interpolate_zero(times: np.ndarray, values: np.ndarray, ticks: np.ndarray,
+                     rows: np.ndarray) -> np.ndarray:
+    """Zero-order hold: value of the last row before each tick."""
+    return np.where(rows > 0, values[np.maximum(rows - 1, 0)], np.nan)
+
+
+def interpolate_nearest(times: np.ndarray, values: np.ndarray, ticks: np.ndarray,
+                        rows: np.ndarray) -> np.ndarray:
+    """Value of the row nearest to each tick, the row before it on a tie."""
+    before = np.maximum(rows - 1, 0)
+    after = np.minimum(rows, len(times) - 1)
+    nearest = np.where(ticks - times[before] <= times[after] - ticks, before, after)
+    return values[nearest]
+
+
+def _knots(times: np.ndarray, values: np.ndarray) -> tuple:
+    """Knots of a spline: the rows with a value, at increasing times."""
+    kept = ~np.isnan(values)
+    kept[1:] &= np.diff(times) > 0
+    return times[kept], values[kept]
+
+
+def _hermite(times: np.ndarray, values: np.ndarray, slopes: np.ndarray,
+             ticks: np.ndarray) -> np.ndarray:
+    """Cubic Hermite polynomials through the knots with these slopes, at the ticks."""
+    k = np.clip(np.searchsorted(times, ticks, side='right') - 1, 0, len(times) - 2)
+    h = (times[k + 1] - times[k]) / 1e9
+    t = (ticks - times[k]) / (times[k + 1] - times[k])
+    return ((2 * t**3 - 3 * t**2 + 1) * values[k]
+            + (t**3 - 2 * t**2 + t) * h * slopes[k]
+            + (-2 * t**3 + 3 * t**2) * values[k + 1]
+            + (t**3 - t**2) * h * slopes[k + 1])
+
+
+def pchip_slopes(times: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Slopes (per second) at the knots of the monotone piecewise cubic
+    interpolation of Fritsch and Carlson: null at a local extremum, else
+    the weighted harmonic mean of the secants, and from three points at
+    both ends. A slope only depends on the knots around it.
+    """
+    h = np.diff(times) / 1e9
+    secants = np.diff(values) / h
+    slopes = np.zeros(len(times))
+    if len(times) == 2:
+        slopes[:] = secants[0]
+        return slopes
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    monotone = secants[:-1] * secants[1:] > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = (w1 + w2) / (w1 / secants[:-1] + w2 / secants[1:])
+    slopes[1:-1] = np.where(monotone, harmonic, 0.0)
+    for end, (h0, h1, s0, s1) in ((0, (h[0], h[1], secants[0], secants[1])),
+                                  (-1, (h[-1], h[-2], secants[-1], secants[-2]))):
+        slope = ((2 * h0 + h1) * s0 - h0 * s1) / (h0 + h1)
+        if np.sign(slope) != np.sign(s0):
+            slope = 0.0
+        elif np.sign(s0) != np.sign(s1) and abs(slope) > 3 * abs(s0):
+            slope = 3 * s0
+        slopes[end] = slope
+    return slopes
+
+
+def interpolate_pchip(times: np.ndarray, values: np.ndarray, ticks: np.ndarray,
+                      rows: np.ndarray) -> np.ndarray:
+    """
+    Monotone piecewise cubic (PCHIP) interpolation through the rows of the
+    set. The value at a tick only depends on the two rows before and after
+    it, the times being taken from these rows: the windows of the sets
+    give the values of the whole sets.
+    """
+    times, values = _knots(times, values)
+    if len(times) < 2:
+        return np.full(len(ticks), np.nan)
+    return _hermite(times, values, pchip_slopes(times, values), ticks)
+
+
+def solve_tridiagonal(lower: np.ndarray, diagonal: np.ndarray, upper: np.ndarray,
+                      rhs: np.ndarray) -> np.ndarray:
+    """
+    Solve the tridiagonal system ``lower[i] x[i-1] + diagonal[i] x[i] +
+    upper[i] x[i+1] = rhs[i]`` by parallel cyclic reduction: each of the
+    log2(n) steps eliminates the unknowns at a distance doubling, on whole
+    arrays. The system shall be diagonally dominant, as the one of a spline.
+    """
+    a, b, c, d = (np.asarray(v, dtype=np.float64).copy()
+                  for v in (lower, diagonal, upper, rhs))
+    n = len(b)
+    a[0] = c[-1] = 0.0
+    stride = 1
+    while stride < n:
+        # the equations out of the system are x = 0
+        a_, b_, c_, d_ = (_padded(a, stride, 0.0), _padded(b, stride, 1.0),
+                          _padded(c, stride, 0.0), _padded(d, stride, 0.0))
+        below, above = slice(0, n), slice(2 * stride, n + 2 * stride)
+        alpha = -a / b_[below]
+        gamma = -c / b_[above]
+        a, b, c, d = (alpha * a_[below],
+                      b + alpha * c_[below] + gamma * a_[above],
+                      gamma * c_[above],
+                      d + alpha * d_[below] + gamma * d_[above])
+        stride *= 2
+    return d / b
+
+
+def _padded(array: np.ndarray, width: int, fill: float) -> np.ndarray:
+    """Array with ``width`` values ``fill`` before and after it."""
+    return np.pad(array, width, constant_values=fill)
+
+
+def cubic_second_derivatives(times: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Second derivatives at the knots of the natural cubic spline (null at both ends)."""
+    second = np.zeros(len(times))
+    if len(times) > 2:
+        h = np.diff(times) / 1e9
+        secants = np.diff(values) / h
+        second[1:-1] = solve_tridiagonal(h[:-1], 2 * (h[:-1] + h[1:]), h[1:],
+                                         6 * np.diff(secants))
+    return second
+
+
+def interpolate_cubic(times: np.ndarray, values: np.ndarray, ticks: np.ndarray,
+                      rows: np.ndarray) -> np.ndarray:
+    """
+    Natural cubic spline interpolation through the rows of the set. The
+    spline depends on all the rows: it is not computed on windows of the
+    sets (see ``GLOBAL_INTERPOLATIONS``).
+    """
+    times, values = _knots(times, values)
+    if len(times) < 2:
+        return np.full(len(ticks), np.nan)
+    second = cubic_second_derivatives(times, values)
+    k = np.clip(np.searchsorted(times, ticks, side='right') - 1, 0, len(times) - 2)
+    h = (times[k + 1] - times[k]) / 1e9
+    left, right = (ticks - times[k]) / 1e9, (times[k + 1] - ticks) / 1e9
+    return ((second[k] * right**3 + second[k + 1] * left**3) / (6 * h)
+            + (values[k] / h - second[k] * h / 6) * right
+            + (values[k + 1] / h - second[k + 1] * h / 6) * left)
+
+
+# handling of the empty intervals in the gaps between the regular runs of
+# a set: interpolated as the other ones, or left empty
+GAPS = ('interpolate', 'empty')
+
+# interpolations depending on all the rows of a set, not on the rows around
+# the tick only, which cannot be computed on windows of the sets
+GLOBAL_INTERPOLATIONS = ('cubic',)
+
+interpolations = {
+    'linear': interpolate_linear,
+    'zero': interpolate_zero,
+    'nearest': interpolate_nearest,
+    'pchip': interpolate_pchip,
+    'cubic': interpolate_cubic,
+}
+
+
+def get_interpolation(name: str):
+    """Interpolation of the registry with this name."""
+    if name not in interpolations:
+        raise ValueError(f'Interpolation {name} not in {list(interpolations)}.')
+    return interpolations[name]
+
+
+def align_set(times: np.ndarray, values: np.ndarray, ticks: np.ndarray,
+              step: int, end: int, reducer: str = 'mean',
+              interpolation: str = 'linear', locate=None,
+              in_gap: np.ndarray = None) -> np.ndarray:
+    """
+    Values of a set on the ticks of the grid, NaN for the ticks left empty,
+    the values of an interval being given by the reducer with this name,
+    and the ones of the empty intervals by the interpolation with this name.
+    ``locate`` finds the rows of the ticks (see ``interval_rows``). The
+    times of a regular set can be given by its ``RegularSeries``, which
+    locates the rows: they are then only computed for the interpolation.
+    The ticks of the mask ``in_gap`` are left empty when their interval is.
+    """
+    if isinstance(times, RegularSeries):
+        locate = times.index_of
+    reduce = get_reducer(reducer)
+    interpolate = get_interpolation(interpolation)
+    result = np.full(len(ticks), np.nan)
+    if len(times) < 2 or len(ticks) == 0:
+        return result
+    first, last, computed = interval_rows(times, ticks, step, end, locate)
+    filled = computed & (last > first)
+    empty = computed & (last == first)
+    if in_gap is not None:
+        empty &= ~in_gap
+    empty = np.flatnonzero(empty)
+
+    if filled.any():
+        reduced = reduce(values, first[filled], last[filled])
+        result[filled] = round_values(np.asarray(reduced, dtype=np.float64))
+
+    if len(empty):
+        # all the empty intervals of the set in a single call
+        if isinstance(times, RegularSeries):
+            times = times.times
+        interpolated = interpolate(times, values, ticks[empty], first[empty])
+        result[empty] = round_values(np.asarray(interpolated, dtype=np.float64))
+    return result
+
+
+def _segment_locator(segments):
+    """Rows of the last times at or before some times, from a ``SegmentIndex``."""
+    return lambda at: segments.locate(at)[0]
+
+
+def _set_segments(entry, times: np.ndarray) -> SegmentIndex:
+    """Runs of a set, at once for a set with a known constant step."""
+    if getattr(entry, 'step', None) is not None:
+        return set_segments(entry)
+    return SegmentIndex.from_times(times)
+
+
+def aligned_table(data: dict, start: pd.Timestamp, end: pd.Timestamp,
+                  step: pd.Timedelta, reducer: str = 'mean',
+                  interpolation: str = 'linear', count: int = None,
+                  gaps: str = 'interpolate') -> pd.DataFrame:
+    """
+    Table of the sets (in any of the forms of ``measureSet.measure_arrays``)
+    aligned on the ticks from ``start`` to ``end`` every ``step``, with the
+    reducer and the interpolation of these names. With ``count``, only the
+    first ``count`` ticks are computed, the values after ``end`` being
+    still not used.
+
+    The rows of a set made of regular runs are located arithmetically in
+    its runs (see ``setsSteps.SegmentIndex``). With ``gaps='empty'``, the
+    empty intervals of the ticks in a gap between two runs are left NaN
+    instead of being interpolated.
+    """
+    if gaps not in GAPS:
+        raise ValueError(f'Gaps {gaps!r} not in {GAPS}.')
+    last = end.value if count is None else min(end.value, start.value + count * step.value)
+    ticks = grid_ticks(start.value, last, step.value)
+    columns = {}
+    for name, entry in data.items():
+        if isinstance(entry, RegularSeries):
+            # the rows are found by the series, without its times
+            columns[name] = align_set(entry, entry.values, ticks, step.value,
+                                      end.value, reducer, interpolation)
+            continue
+        times, values = measure_arrays(entry)
+        times = np.asarray(times, dtype=np.int64)
+        segments = _set_segments(entry, times)
+        locate = in_gap = None
+        if gaps == 'empty':
+            in_gap = segments.locate(ticks)[1]
+        if 2 * len(segments) <= len(times):
+            # mostly regular runs: the rows are found arithmetically in them
+            locate = _segment_locator(segments)
+        columns[name] = align_set(times, np.asarray(values, dtype=np.float64),
+                                  ticks, step.value, end.value, reducer,
+                                  interpolation, locate, in_gap)
+    table = pd.DataFrame(columns, index=pd.DatetimeIndex(ticks, name='datetime'))
+    return table
@@ -1,16 +1,26 @@
 #!/usr/bin/env python3
 
 from collections import defaultdict
-from collections.abc import Callable
-from datetime import datetime, timedelta
+from collections.abc import Callable, Mapping
+from datetime import datetime
 from math import lcm, gcd
+import numpy as np
 import pandas as pd
 from tabulate import tabulate
-import random
-import re
+import io
 
 from tkinter import messagebox
 
+from lib.setsReader import detect_datetime_format, collect_measures, measure_pairs
+from lib.setsReader import parse_datetime
+from lib.setsReader import LazySets, open_measures
+from lib.measureSet import RegularSeries, measure_arrays
+from lib.measureSet import pack_values, unpack_values
+from lib.setsValidation import RowError
+from lib.setsStore import ChunkedStore
+from lib.setsSteps import steps_report, set_segments
+from lib.setsAlignment import aligned_table, GLOBAL_INTERPOLATIONS
+
 """
 The default choices for synchronizing the data sets
 - start, end: max, min or a date-time as a string ;
@@ -29,6 +39,21 @@ number of coincidences. lcm > gcd
 step = integer: means a time step is imposed disregarding existing
 ones. A general interpolation will be done.
 
+precision: float64, float32 or scaled, storage of the values of the
+synchronized table (see ``measureSet.pack_values``), given back in
+float64 by ``unpack_table`` for the display and the export.
+
+reducer: value of an interval from the values of a set in it, mean, min,
+max, first, last, median, sum, count, std or range, or the name of a
+reducer added by ``setsAlignment.register_reducer``.
+
+interpolation: value of an interval without value of a set, linear
+between the values around it, zero (the value before it), nearest, pchip
+(monotone piecewise cubic) or cubic (natural cubic spline).
+
+gaps: the intervals without value in a gap between the regular runs of a
+set (see ``setsSteps.SegmentIndex``) are interpolated, or left empty.
+
 >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 >> In the first version we choose: 
 >>  step=gcd
@@ -42,13 +67,17 @@ default_choices = {
     'start': 'max',
     'end': 'min',
     'step': 'gcd',
-    'datetime_format': '%Y-%m-%d %H:%M:%S'
+    'datetime_format': '%Y-%m-%d %H:%M:%S',
+    'precision': 'float64',
+    'reducer': 'mean',
+    'interpolation': 'linear',
+    'gaps': 'interpolate',
 }
 def get_default_choices() -> dict:
     return default_choices
 
 
-def read_measures(filename: str) -> dict:
+def read_measures(filename: str, errors: list = None) -> dict:
     """
     Read a filename containing sets of data one below each other
     and return a list measures.
@@ -59,8 +88,12 @@ def read_measures(filename: str) -> dict:
         'meas02': [(date, value), (date, value) ...],
         ...
     }
+
+    The rows which cannot be converted are skipped, and added to the list
+    ``errors`` when it is given (see ``setsValidation.validate_measures``
+    to check a whole file before reading it).
     """
-    with open(filename, 'r') as file:
+    with io.TextIOWrapper(open_measures(filename)) as file:
         lines = file.readlines()
 
         measures = defaultdict(list)
@@ -74,49 +107,52 @@ def read_measures(filename: str) -> dict:
         name = 'xxx'
         date_format_checked = False
         datetime_format = '%Y-%m-%d %H:%M:%S'
-        for line in lines:
+        for number, line in enumerate(lines, start=1):
             if ',' in line:
-                date_str, value_str = line.strip().split(',')
+                date_str, _, value_str = line.strip().partition(',')
                 if not date_format_checked:
                     datetime_format = check_datetime_format(date_str)
                     date_format_checked = True
                 try:
-                    date = datetime.strptime(date_str, datetime_format)
+                    reason = 'date-time'
+                    date = parse_datetime(date_str, datetime_format)
+                    reason = 'value'
                     value = float(value_str)
-                except ValueError as err:
-                    messagebox.showerror(
-                        title='ValueError with File',
-                        message="Script and data file format don't match."
-                    )
+                except (TypeError, ValueError):
+                    if errors is not None:
+                        errors.append(RowError(number, name, line.strip(), reason))
+                    continue
                 measures[name].append((date, value))
             else:
                 name = line.strip()
-                # if ms for one set, applies for all
-                if (datetime_format[-1] != 'f'):
-                    date_format_checked = False
+                # each set has its own format, detected on its first row
+                date_format_checked = False
         return measures
 
+def as_measures(data) -> dict:
+    """
+    Bring sets given as a dictionary of arrays (see ``setsReader``), of
+    ``MeasureSet`` or as a stream of chunks (name, times, values) into the
+    structure returned by ``read_measures``.
+    """
+    if not isinstance(data, Mapping):
+        data = collect_measures(data)
+    return {k: v if isinstance(v, list) else measure_pairs(*measure_arrays(v))
+            for k, v in data.items()}
+
 def check_constant_time_step(data:dict, nb_tests=3) -> bool:
     """
     Check if the time steps between measure is constant.
-    The complete check is too long for large sets,
-    so we do sampling test instead.
+    All the steps are checked at once on the int64 times (see
+    ``setsSteps.steps_report``), ``nb_tests`` being kept for the former
+    sampling test. The sets kept as ``RegularSeries`` are constant by
+    construction and the step of a ``MeasureSet`` is known.
     """
-    for k in data.keys():
-        _NUMB_MEAS = len(data[k])
-        if _NUMB_MEAS <= 1:
-            raise NameError(f'List {data[k]} has only 1 or less element!')
-
-        _STEP = data[k][1][0] - data[k][0][0]           # first step
-
-        if (data[k][-1][0] - data[k][-2][0] != _STEP):  # compare with last step
-            return False
-
-        for N in range(nb_tests):                       # do random tests
-            _NUM = random.randint(1, _NUMB_MEAS-2)
-            if (data[k][_NUM+1][0] - data[k][_NUM][0] != _STEP):
-                return False
-    return True
+    reports = steps_report(data)
+    for k, report in reports.items():
+        if report.rows <= 1:
+            raise NameError(f'Set {k} has only 1 or less element!')
+    return all(report.regular for report in reports.values())
 
 def check_datetime_format(date_str:str) -> str:
     """
@@ -124,62 +160,85 @@ def check_datetime_format(date_str:str) -> str:
     exact format of the datetime
         'datetime_format': '%Y-%m-%d %H:%M:%S'    (default)
         'datetime_format': '%Y-%m-%d %H:%M:%S.%f' (with milliseconds)
+    and the other formats of ``setsReader.detect_datetime_format`` (ISO
+    8601 with an offset to UTC, time since the epoch). The global
+    ``default_choices`` is not modified.
     """
-    pattern = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}'
-    if bool(re.search(pattern, date_str)):
-        result = '%Y-%m-%d %H:%M:%S.%f'
-        default_choices['datetime_format'] = result
-        return result
-
-    pattern = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}'
-    if bool(re.search(pattern, date_str)):
-        result = '%Y-%m-%d %H:%M:%S'
-        return result
-
-    pattern = r'\d{2}:\d{2}:\d{2}\.\d{3}'
-    if bool(re.search(pattern, date_str)):
-        result = '%H:%M:%S.%f'
-        default_choices['datetime_format'] = result
-        return result
-
-    pattern = r'\d{2}:\d{2}:\d{2}'
-    if bool(re.search(pattern, date_str)):
-        result = '%H:%M:%S'
-        return result
+    return detect_datetime_format(date_str)
+
+def set_bounds(data: dict, name: str) -> tuple:
+    """
+    Return the first, second and last date-times of a set, as
+    ``pandas.Timestamp`` exact to the nanosecond. For sets loaded lazily,
+    they are taken from the index without parsing the set.
+    """
+    if isinstance(data, LazySets):
+        bounds = data.bounds(name)
+    elif isinstance(data[name], list):
+        bounds = [data[name][0][0], data[name][1][0], data[name][-1][0]]
+    elif isinstance(data[name], RegularSeries):
+        series = data[name]
+        bounds = [series.start, series.start + series.step, series.end]
+    else:
+        bounds = measure_arrays(data[name])[0][[0, 1, -1]].tolist()
+    return tuple(pd.Timestamp(t) for t in bounds)
+
+def set_step(data: dict, name: str, bounds: tuple) -> pd.Timedelta:
+    """
+    Return the time step of a set, exact to the nanosecond: the nominal
+    step of its regular runs (see ``setsSteps.SegmentIndex``), so that a
+    gap at its start does not change it. The sets of ``LazySets`` not yet
+    parsed take the step between their first two times, from the index;
+    the times of a ``ChunkedStore`` are read from the disk.
+    """
+    if isinstance(data, LazySets) and not data.is_loaded(name):
+        return bounds[1] - bounds[0]
+    step = set_segments(data[name]).step
+    if step is None:
+        return bounds[1] - bounds[0]
+    return pd.Timedelta(step)
 
 def sets_starts_ends_steps(data: dict) -> dict:
     """
     Analyze the characteristics of sets of measures:
     - the min, max starting date-time
     - the min, max ending date-time
-    - the time steps with their gcd and lcm
+    - the time steps with their gcd and lcm, the step of a set being
+      the one of its regular runs (see ``set_step``)
+    All the times are ``pandas.Timestamp`` and ``pandas.Timedelta``,
+    exact to the nanosecond.
+    The sets of ``LazySets`` not yet parsed are analyzed from the index.
+    The result is kept on the data when it has a ``characteristics``
+    attribute (``MeasureSets``, ``LazySets``, ``ChunkedStore``), and read
+    from it by the next calls until the sets change.
     """
+    if getattr(data, 'characteristics', None) is not None:
+        return data.characteristics
     result = {}
-    _starts = [data[k][0][0] for k in data.keys()]
+    _bounds = [set_bounds(data, k) for k in data.keys()]
+    _starts = [b[0] for b in _bounds]
     result['starts'] = _starts
     result['start_earliest'] = min(_starts)
     result['start_latest'] = max(_starts)
-    _ends = [data[k][-1][0] for k in data.keys()]
+    _ends = [b[2] for b in _bounds]
     result['ends'] = _ends
     result['end_earliest'] = min(_ends)
     result['end_latest'] = max(_ends)
 
-    _time_steps = [(data[k][1][0] - data[k][0][0]) for k in data.keys()]
+    _time_steps = [set_step(data, k, b) for k, b in zip(data.keys(), _bounds)]
     result['time_step'] = _time_steps
     result['time_step_shortest'] = min(_time_steps)
     result['time_step_longest'] = max(_time_steps)
 
-    if default_choices['datetime_format'][-1] == 'f':
-        # datetime used milliseconds, lcm and gcd are calculated with ms
-        _time_steps_ms = [int(step.total_seconds()*1000)
-                          for step in _time_steps]
-        result['time_step_lcm'] = timedelta(milliseconds= lcm(*_time_steps_ms))
-        result['time_step_gcd'] = timedelta(milliseconds= gcd(*_time_steps_ms))
-    else:
-        _time_steps = [int(step.total_seconds()) for step in _time_steps]
-        result['time_step_lcm'] = timedelta(seconds=lcm(*_time_steps))
-        result['time_step_gcd'] = timedelta(seconds= gcd(*_time_steps))
+    result['with_ms'] = any(date.microsecond or date.nanosecond
+                            for date in _starts + _ends)
+    # lcm and gcd are calculated exactly on the steps in nanoseconds
+    _time_steps_ns = [step.value for step in _time_steps]
+    result['time_step_lcm'] = pd.Timedelta(lcm(*_time_steps_ns))
+    result['time_step_gcd'] = pd.Timedelta(gcd(*_time_steps_ns))
 
+    if hasattr(data, 'characteristics'):
+        data.characteristics = result
     return result
 
 def report_on_sets(data: dict) -> str:
@@ -192,11 +251,9 @@ def report_on_sets(data: dict) -> str:
     """
     _RES = sets_starts_ends_steps(data)
 
-    time_format = default_choices['datetime_format']
-    if (time_format[-1] == 'f'):
-        with_ms = True
-    else:
-        with_ms = False
+    # the fraction of second is shown when the sets have one
+    with_ms = _RES['with_ms'] or any(step.microseconds for step in _RES['time_step'])
+    time_format = '%Y-%m-%d %H:%M:%S.%f' if with_ms else '%Y-%m-%d %H:%M:%S'
 
     _LLIST = []
     if with_ms:
@@ -245,7 +302,8 @@ def report_on_sets(data: dict) -> str:
 
 def choose_start_end_step(data: dict, synchro_choice=default_choices) -> list:
     """
-    From sets of data and settings determine start, end and step.
+    From sets of data and settings determine start, end and step, as
+    ``pandas.Timestamp`` and ``pandas.Timedelta`` exact to the nanosecond.
     """
     # determine start / end / step according to settings
     char = sets_starts_ends_steps(data)
@@ -260,14 +318,16 @@ def choose_start_end_step(data: dict, synchro_choice=default_choices) -> list:
             _start = char['start_latest']
         case _:
             try:
-                _start = datetime.strptime(char['start'], 
-                                           synchro_choice['datetime_format'])
+                _start = synchro_choice['start']
+                if not isinstance(_start, datetime):
+                    _start = datetime.strptime(_start,
+                                               synchro_choice['datetime_format'])
                 if (_start < char['start_latest']):
                     start_with_empties = True
             except ValueError:
                 messagebox.showerror(
                         title='Date format error',
-                        message=f'Start date {_start} not matching chosen format settings.')
+                        message=f"Start date {synchro_choice['start']} not matching chosen format settings.")
 
     match synchro_choice['end']:
         case 'min':
@@ -277,14 +337,16 @@ def choose_start_end_step(data: dict, synchro_choice=default_choices) -> list:
             end_with_empties = True
         case _:
             try:
-                _end = datetime.strptime(char['date'], 
-                                         synchro_choice['datetime_format'])
-                if (_end > char['end_soonest']):
-                    end_with_empties = False
+                _end = synchro_choice['end']
+                if not isinstance(_end, datetime):
+                    _end = datetime.strptime(_end,
+                                             synchro_choice['datetime_format'])
+                if (_end > char['end_earliest']):
+                    end_with_empties = True
             except ValueError:
                 messagebox.showerror(
                         title='Date format error', 
-                        message=f'End date {_end} not matching chosen format settings.')
+                        message=f"End date {synchro_choice['end']} not matching chosen format settings.")
     
     match synchro_choice['step']:
         case 'lcm':
@@ -307,27 +369,87 @@ def choose_start_end_step(data: dict, synchro_choice=default_choices) -> list:
         messagebox.showinfo('Development pending', 'For this version, all sets shall have ending values.')
         return {}
 
-    return (_start,  _end, _step)
+    return (pd.Timestamp(_start), pd.Timestamp(_end), pd.Timedelta(_step))
+
+
+def mean_value(values: list) -> float:
+    """Value of an interval: the mean of its values, rounded to 4 decimals."""
+    return round(sum(values)/len(values), 4)
+
+
+def linear_value(t, t1, t2, v1, v2) -> float:
+    """Value of an empty interval: interpolated at its time t, rounded to 4 decimals."""
+    return round(v1 + (t-t1)*(v2-v1)/(t2-t1), 4)
 
 
 def synchronized_sets(data: dict, 
                       synchro_choice=default_choices, 
-                      choose_value=lambda x: round(sum(x)/len(x),4),
-                      interpol=lambda t,t1,t2,v1,v2: round(v1 + (t-t1)*(v2-v1)/(t2-t1),4)) -> pd.DataFrame:
+                      choose_value=mean_value,
+                      interpol=linear_value) -> pd.DataFrame:
     '''
     From a dict containing all measures, propose the common time frame
     and re-arrange measure into a table, which is a list of list.
     The internal list is composed of a date-time followed by each values,
     the external list loops over time.
+
+    The sets can also be given as arrays or as the stream of chunks of
+    ``setsReader.iter_measures``, or as a ``setsStore.ChunkedStore``
+    which is then synchronized chunk by chunk.
+
+    With the default functions of the values, the sets are aligned on
+    whole arrays by ``setsAlignment.aligned_table``, the value of an
+    interval being given by the reducer ``synchro_choice['reducer']`` and
+    the one of an empty interval by ``synchro_choice['interpolation']``,
+    unless it is in a gap of the set and ``synchro_choice['gaps']`` is
+    ``empty``; other functions are called on each interval by ``synchronized_loop``.
     '''
+    if isinstance(data, ChunkedStore):
+        return synchronized_store(data, synchro_choice, choose_value, interpol)
+    if not isinstance(data, Mapping):
+        data = collect_measures(data)
 
-    # get the start, end and step from data and settings
+    # get the start, end and step from data and settings, the
+    # characteristics of the sets being kept on the data between calls
+    _start, _end, _step = choose_start_end_step(data, synchro_choice)
+    if choose_value is not mean_value or interpol is not linear_value:
+        return synchronized_loop(data, synchro_choice, choose_value, interpol)
+    df = aligned_table(data, _start, _end, _step,
+                       synchro_choice.get('reducer', 'mean'),
+                       synchro_choice.get('interpolation', 'linear'),
+                       gaps=synchro_choice.get('gaps', 'interpolate'))
+    return pack_table(df, synchro_choice.get('precision', 'float64'))
+
+
+def synchronized_loop(data: dict,
+                      synchro_choice=default_choices,
+                      choose_value=mean_value,
+                      interpol=linear_value) -> pd.DataFrame:
+    '''
+    Synchronize the sets as ``synchronized_sets``, by walking through the
+    values of each set and calling ``choose_value`` on the values of each
+    interval, or ``interpol`` on an empty one. This loop is the reference
+    of the vectorized ``setsAlignment.aligned_table``.
+    '''
     _start, _end, _step = choose_start_end_step(data, synchro_choice)
+    df = loop_table(as_measures(data), _start, _end, _step, choose_value, interpol)
+    return pack_table(df, synchro_choice.get('precision', 'float64'))
 
-    # Create a table of synchronized time ticks
+
+def loop_table(data: dict, _start: pd.Timestamp, _end: pd.Timestamp,
+               _step: pd.Timedelta, choose_value=mean_value,
+               interpol=linear_value, count: int = None) -> pd.DataFrame:
+    '''
+    Table of the loop of ``synchronized_loop`` on the sets of
+    ``read_measures``, for ``count`` ticks from ``_start`` (all the ticks
+    before ``_end`` by default), the values after ``_end`` being not used.
+    '''
+    # Create a table of synchronized time ticks, in integer nanoseconds
     dataSync = {}
-    numb_posSync = int((_end - _start).total_seconds() // _step.total_seconds())
-    dataSync['time'] = [_start + i*_step for i in range(numb_posSync)]
+    numb_posSync = (_end.value - _start.value) // _step.value
+    if count is not None:
+        numb_posSync = min(numb_posSync, count)
+    ticks = _start.value + _step.value * np.arange(numb_posSync, dtype=np.int64)
+    dataSync['time'] = list(pd.DatetimeIndex(ticks))
     lastPosSync = numb_posSync - 1
 
     # generate list of synchronized values
@@ -382,14 +504,122 @@ def synchronized_sets(data: dict,
                 break
 
     # transfer into a pandas DateFrame
-    df = pd.DataFrame({'datetime':pd.to_datetime(dataSync['time'])})
+    df = pd.DataFrame({'datetime': pd.DatetimeIndex(ticks)})
     for name in data.keys():
         df[name] = dataSync[name]
     df.set_index('datetime', inplace=True)
-
     return df
 
 
+def synchronized_store(store: ChunkedStore,
+                       synchro_choice=default_choices,
+                       choose_value=mean_value,
+                       interpol=linear_value) -> pd.DataFrame:
+    '''
+    Synchronize the sets of a ``ChunkedStore`` as ``synchronized_sets``,
+    by time windows of the duration of the chunks: for each window, only
+    the rows of the sets around the window are read from the disk. The
+    interpolations computed on the whole sets (``cubic``) are refused.
+    '''
+    interpolation = synchro_choice.get('interpolation', 'linear')
+    if interpolation in GLOBAL_INTERPOLATIONS:
+        raise ValueError(f"interpolation '{interpolation}' needs the whole sets, "
+                         "not the windows of a chunked store")
+    _start, _end, _step = choose_start_end_step(store, synchro_choice)
+    numb_posSync = (_end.value - _start.value) // _step.value
+    _step_ns = _step.value
+    per_window = max(store.chunk_ns // _step_ns, 1)
+    # the last ticks of a window need the next value of each set
+    _overlap = sets_starts_ends_steps(store)['time_step_longest'] + 2*_step
+    vectorized = choose_value is mean_value and interpol is linear_value
+
+    parts = []
+    for first in range(0, numb_posSync, per_window):
+        last = min(first + per_window, numb_posSync)
+        _first = _start + first * _step
+        _last = _start + last * _step
+        window = {name: store.window(name, (_first - _overlap).value,
+                                     (_last + _overlap).value)
+                  for name in store}
+        # the end of the table, not of the window, limits the values used:
+        # the next value of a set may be after the window, after a gap
+        if vectorized:
+            parts.append(aligned_table(window, _first, _end, _step,
+                                       synchro_choice.get('reducer', 'mean'),
+                                       interpolation, count=last - first,
+                                       gaps=synchro_choice.get('gaps', 'interpolate')))
+        else:
+            parts.append(loop_table(as_measures(window), _first, _end, _step,
+                                    choose_value, interpol, count=last - first))
+    table = pd.concat(parts).infer_objects()
+    return pack_table(table, synchro_choice.get('precision', 'float64'))
+
+
+def pack_table(table: pd.DataFrame, precision: str) -> pd.DataFrame:
+    """
+    Store the columns of a synchronized table with the precision float32
+    or scaled (see ``measureSet.pack_values``), the values being rounded
+    to 4 decimals by ``synchronized_sets``. The decimals of each column are
+    kept in ``table.attrs['decimals']``.
+    """
+    if precision == 'float64':
+        return table
+    columns, decimals = {}, {}
+    for name in table.columns:
+        values = table[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        columns[name], decimals[name] = pack_values(values, precision, max_decimals=4)
+    result = pd.DataFrame(columns, index=table.index)
+    result.attrs['decimals'] = decimals
+    return result
+
+
+def unpack_table(table: pd.DataFrame) -> pd.DataFrame:
+    """Give back in float64 a table stored by ``pack_table``."""
+    decimals = table.attrs.get('decimals')
+    if not decimals:
+        return table
+    return pd.DataFrame({name: unpack_values(table[name].to_numpy(), decimals[name])
+                         for name in table.columns}, index=table.index)
+
+
+def synchronized_tail(table: pd.DataFrame, data: dict,
+                      synchro_choice=default_choices) -> pd.DataFrame:
+    """
+    Extend a synchronized table after new rows were appended to the sets
+    (see ``setsReader.TailReader``): only the time ticks from the last
+    value of the column ending first are computed again, from the end of
+    each set. The whole table is computed when the sets are not the
+    columns of the table, or for an interpolation computed on the whole
+    sets (``cubic``).
+    """
+    if (table.empty or list(table.columns) != list(data.keys())
+            or synchro_choice.get('interpolation', 'linear') in GLOBAL_INTERPOLATIONS):
+        return synchronized_sets(data, synchro_choice)
+    precision = synchro_choice.get('precision', 'float64')
+    table = unpack_table(table)
+    _start, _end, _step = choose_start_end_step(data, synchro_choice)
+    # the last value of a set is not used and the ticks after it are left
+    # empty, the last lines being computed without the values after them
+    filled = table.notna().to_numpy()
+    last_filled = np.where(filled.any(axis=0),
+                           len(table) - 1 - np.argmax(filled[::-1], axis=0), 0)
+    restart = max(min(int(last_filled.min()), len(table) - 2), 0)
+    if _end - table.index[-1] < _step and restart == len(table) - 2:
+        return pack_table(table, precision)
+    _next = table.index[restart]
+
+    # keep from each set the values needed around the new ticks, with the
+    # two rows before them giving the slopes of the pchip interpolation
+    window = {}
+    for name, entry in data.items():
+        times, values = measure_arrays(entry)
+        first = np.searchsorted(times, (_next - 2*_step).value) - 3
+        window[name] = (times[max(first, 0):], values[max(first, 0):])
+    choice = dict(synchro_choice, start=_next, precision='float64')
+    tail = synchronized_sets(window, choice).astype(table.dtypes)
+    return pack_table(pd.concat([table.iloc[:restart], tail]), precision)
+
+
 if __name__ == '__main__':
 
     filename = './dat/data.csv'
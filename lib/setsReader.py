@@ -0,0 +1,932 @@
+#!/usr/bin/env python3
+
+import bz2
+import glob
+import gzip
+import io
+import itertools
+import lzma
+import mmap
+import os
+import queue
+import re
+import threading
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+
+from lib.measureSet import MeasureSets
+
+"""
+Vectorized reading of the sets of measures.
+
+The sets are read as in ``setsManagement.read_measures``, but instead of
+building one ``(datetime, value)`` tuple per line, the rows of each set are
+collected into chunks and converted in bulk by NumPy. Each set becomes a
+couple of arrays:
+- times: int64, nanoseconds since the epoch (1970-01-01 00:00:00) in UTC,
+  the date-times with an offset to UTC being converted, the others being
+  kept as they are written ;
+- values: float64.
+
+The result is structured as following:
+{
+    'meas01': (times, values),
+    'meas02': (times, values),
+    ...
+}
+"""
+
+reader_settings = {
+    'chunk_bytes': 1 << 22,     # size of the blocks converted at once
+    'workers': None,            # processes for parallel parsing (None: all cores)
+    'split_bytes': 1 << 24,     # size of the blocks given to each process
+    'prefetch_blocks': 4,       # decompressed blocks read in advance
+    'precision': 'float64',     # values kept by the application (see measureSet)
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+# date of reference used by datetime.strptime when only the time is given
+_TIME_ONLY_DATE = b'1900-01-01'
+
+# fixed-width layouts: length of the date prefix, position of the clock,
+# the time-zone offsets (%z) being removed before the layout is decoded
+_FIXED_LAYOUTS = {
+    '%Y-%m-%d %H:%M:%S': (10, 11),
+    '%Y-%m-%d %H:%M:%S.%f': (10, 11),
+    '%Y-%m-%dT%H:%M:%S': (10, 11),
+    '%Y-%m-%dT%H:%M:%S.%f': (10, 11),
+    '%H:%M:%S': (0, 0),
+    '%H:%M:%S.%f': (0, 0),
+}
+
+# times since the epoch, with the nanoseconds of their unit
+_EPOCH_UNITS = {
+    'epoch_s': 1_000_000_000,
+    'epoch_ms': 1_000_000,
+    'epoch_us': 1_000,
+    'epoch_ns': 1,
+}
+
+# patterns of the date-times accepted in the input files, with their format
+_FORMAT_PATTERNS = [
+    (re.compile(r'\d{2}:\d{2}:\d{2}'), '%H:%M:%S'),
+    (re.compile(r'\d{2}:\d{2}:\d{2}\.\d{1,9}'), '%H:%M:%S.%f'),
+    (re.compile(r'\d{9,10}(\.\d{1,9})?'), 'epoch_s'),
+    (re.compile(r'\d{12,13}'), 'epoch_ms'),
+    (re.compile(r'\d{15,16}'), 'epoch_us'),
+    (re.compile(r'\d{18,19}'), 'epoch_ns'),
+] + [
+    (re.compile(r'\d{4}-\d{2}-\d{2}' + separator + r'\d{2}:\d{2}:\d{2}'
+                + fraction + zone),
+     f'%Y-%m-%d{separator}%H:%M:%S' + fraction_format + zone_format)
+    for separator in (' ', 'T')
+    for fraction, fraction_format in (('', ''), (r'\.\d{1,9}', '.%f'))
+    for zone, zone_format in (('', ''), (r'(Z|[+-]\d{2}:?\d{2})', '%z'))
+]
+
+_DECODED_FORMATS = {datetime_format for _, datetime_format in _FORMAT_PATTERNS}
+
+# rows of a set sampled to infer its datetime format
+_FORMAT_SAMPLES = 8
+
+# seconds of the day of a clock hh:mm:ss read as the integer hhmmss,
+# -1 for the integers not being a valid clock (86 400 valid entries)
+_CLOCK_SECONDS = np.full(240000, -1, dtype=np.int64)
+_H, _M, _S = np.meshgrid(np.arange(24), np.arange(60), np.arange(60),
+                         indexing='ij')
+_CLOCK_SECONDS[(_H*10000 + _M*100 + _S).ravel()] = (_H*3600 + _M*60 + _S).ravel()
+del _H, _M, _S
+
+
+def detect_datetime_format(date_str: str) -> str:
+    """
+    Determine the format of a date-time string among the ones accepted
+    in the input files, or None:
+        '%Y-%m-%d %H:%M:%S'    (default)
+        '%Y-%m-%d %H:%M:%S.%f' (with a fraction of second, up to ns)
+        '%H:%M:%S'             (only time)
+        '%H:%M:%S.%f'          (only time with a fraction of second)
+        the same with 'T' between the date and the time (ISO 8601),
+        followed or not by an offset to UTC: 'Z', '+02:00' or '+0200' (%z)
+        'epoch_s', 'epoch_ms', 'epoch_us', 'epoch_ns' (time since the epoch)
+    """
+    date_str = date_str.strip()
+    for pattern, datetime_format in _FORMAT_PATTERNS:
+        if pattern.fullmatch(date_str):
+            return datetime_format
+    return None
+
+
+def infer_datetime_format(raw: np.ndarray) -> str:
+    """
+    Infer the datetime format of a set from a sample of up to
+    ``_FORMAT_SAMPLES`` of its date-times, or of its rows starting with
+    their date-time, given as bytes: the format found on most of them.
+    Nothing global is modified, so the sets can be parsed at the same time.
+    """
+    if len(raw) == 0:
+        return None
+    positions = np.unique(np.linspace(0, len(raw) - 1, _FORMAT_SAMPLES).astype(int))
+    formats = Counter(detect_datetime_format(
+        raw[i].split(b',')[0].decode(errors='replace')) for i in positions.tolist())
+    formats.pop(None, None)
+    return formats.most_common(1)[0][0] if formats else None
+
+
+@lru_cache(maxsize=4096)
+def _day_epoch_ns(date: bytes) -> int:
+    """Nanoseconds since the epoch of a date 'YYYY-mm-dd' at midnight."""
+    return int(np.datetime64(date.decode(), 'D').astype('datetime64[ns]')
+               .view(np.int64))
+
+
+def decode_timestamps(raw: np.ndarray, datetime_format: str) -> tuple:
+    """
+    Decode an array of date-time byte strings in one of the formats of
+    ``detect_datetime_format`` into int64 nanoseconds since the epoch,
+    in UTC when the date-times have an offset to UTC. Return the times
+    and the mask of the strings not matching the format.
+    """
+    if datetime_format in _EPOCH_UNITS:
+        return _decode_epoch(raw, _EPOCH_UNITS[datetime_format])
+    if datetime_format.endswith('%z'):
+        raw, offsets, invalid = _split_offsets(raw)
+        times, invalid_clock = _decode_fixed(raw, datetime_format[:-2])
+        return times - offsets, invalid | invalid_clock
+    return _decode_fixed(raw, datetime_format)
+
+
+def _decode_epoch(raw: np.ndarray, unit: int) -> tuple:
+    """
+    Decode times since the epoch written as integers of ``unit``
+    nanoseconds, with an optional fraction, into int64 nanoseconds.
+    """
+    table = np.char.partition(raw, b'.')
+    whole, point, fraction = table[:, 0], table[:, 1], table[:, 2]
+    invalid = ~np.char.isdigit(whole)
+    invalid |= (point == b'.') & ~np.char.isdigit(fraction)
+    whole = np.where(invalid, b'0', whole)
+    fraction = np.where(invalid | (point != b'.'), b'', fraction)
+    nanos = np.char.ljust(fraction, 9, b'0').astype('S9').astype(np.int64)
+    return whole.astype(np.int64) * unit + nanos * unit // 1_000_000_000, invalid
+
+
+def _split_offsets(raw: np.ndarray) -> tuple:
+    """
+    Separate the offsets to UTC written at the end of date-time byte
+    strings ('Z', '+hh:mm' or '+hhmm'). Return the strings without their
+    offset, the offsets in nanoseconds and the mask of the invalid ones.
+    """
+    if len(raw) == 0:
+        return raw, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    raw = np.ascontiguousarray(raw)
+    chars = raw.view(np.uint8).reshape(len(raw), raw.itemsize).copy()
+    lengths = np.char.str_len(raw)
+    rows = np.arange(len(raw))
+
+    def char_at(positions: np.ndarray) -> np.ndarray:
+        return chars[rows, np.clip(positions, 0, raw.itemsize - 1)].astype(np.int64)
+
+    zulu = char_at(lengths - 1) == ord('Z')
+    colon = char_at(lengths - 3) == ord(':')
+    sign_at = np.where(zulu, lengths - 1, np.where(colon, lengths - 6, lengths - 5))
+    sign = char_at(sign_at)
+    digits = [char_at(sign_at + k) - ord('0') for k in (1, 2)]
+    digits += [char_at(sign_at + np.where(colon, k + 1, k)) - ord('0') for k in (3, 4)]
+    hours, minutes = digits[0]*10 + digits[1], digits[2]*10 + digits[3]
+    invalid = (sign != ord('+')) & (sign != ord('-'))
+    invalid |= np.any([(d < 0) | (d > 9) for d in digits], axis=0)
+    invalid |= (hours > 23) | (minutes > 59) | (sign_at < 1)
+    invalid &= ~zulu
+    offsets = np.where(sign == ord('-'), -1, 1) * (hours*3600 + minutes*60)
+    offsets = np.where(zulu | invalid, 0, offsets) * 1_000_000_000
+
+    chars[np.arange(raw.itemsize) >= sign_at[:, None]] = 0
+    return chars.view(f'S{raw.itemsize}').ravel(), offsets, invalid
+
+
+def _decode_fixed(raw: np.ndarray, datetime_format: str) -> tuple:
+    """
+    Decode an array of fixed-width date-time byte strings in one of the
+    ``_FIXED_LAYOUTS`` into int64 nanoseconds since the epoch, without
+    going through a generic date-time parser:
+    - the digits are read as a matrix of bytes, one line per date-time ;
+    - the clock hh:mm:ss gives its seconds through ``_CLOCK_SECONDS`` ;
+    - the dates are resolved once per run of identical dates (cached).
+    Return the times and the mask of the strings not matching the layout.
+    """
+    date_len, clock = _FIXED_LAYOUTS[datetime_format]
+    frac = clock + 9 if datetime_format.endswith('%f') else None
+    # each row is checked against its own length: hh:mm:ss ends the row
+    # without fraction, else 1 to 9 digits of fraction follow the point
+    lengths = np.char.str_len(raw)
+    width = frac + 9 if frac else clock + 8
+    raw = np.ascontiguousarray(raw)
+    chars = np.zeros((len(raw), max(width, raw.itemsize)), dtype=np.uint8)
+    chars[:, :raw.itemsize] = raw.view(np.uint8).reshape(len(raw), raw.itemsize)
+    chars = chars[:, :width]
+    digits = chars - np.uint8(ord('0'))     # wraps above 9 if not a digit
+
+    def number(cols: list) -> np.ndarray:
+        """Integer written by the digits of the columns."""
+        result = digits[:, cols[0]].astype(np.int32)
+        for col in cols[1:]:
+            result *= 10
+            result += digits[:, col]
+        return result
+
+    # the digits of the dates are checked when the dates are resolved
+    clock_cols = [clock, clock+1, clock+3, clock+4, clock+6, clock+7]
+    separators = [(clock+2, ':'), (clock+5, ':')]
+    if date_len:
+        separators += [(date_len, datetime_format[8])]     # ' ' or 'T'
+    if frac:
+        separators += [(frac-1, '.')]
+        invalid = (lengths <= frac) | (lengths > width)
+    else:
+        invalid = lengths != width
+    invalid |= digits[:, clock_cols].max(axis=1) > 9
+    for col, char in separators:
+        invalid |= chars[:, col] != ord(char)
+    if frac:
+        # the digits after the end of a row count as 0
+        written = np.arange(frac, width) < lengths[:, None]
+        fraction = np.where(written, digits[:, frac:width], 0)
+        invalid |= (fraction > 9).any(axis=1)
+        nanoseconds = fraction.astype(np.int64) @ (10 ** np.arange(8, -1, -1, dtype=np.int64))
+
+    seconds = _CLOCK_SECONDS.take(number(clock_cols), mode='clip')
+    invalid |= seconds < 0
+    times = seconds * 1_000_000_000
+    if frac:
+        times += nanoseconds
+
+    if not date_len:
+        return times + _day_epoch_ns(_TIME_ONLY_DATE), invalid
+    dates = np.ascontiguousarray(chars[:, :date_len]).view(f'S{date_len}').ravel()
+    starts = np.concatenate(([0], np.flatnonzero(dates[1:] != dates[:-1]) + 1))
+    days = np.zeros(len(starts), dtype=np.int64)
+    for i, start in enumerate(starts.tolist()):
+        try:
+            days[i] = _day_epoch_ns(dates[start])
+        except ValueError:
+            invalid[start:(starts[i+1] if i+1 < len(starts) else None)] = True
+    return times + np.repeat(days, np.diff(starts, append=len(raw))), invalid
+
+
+def parse_datetime(date_str: str, datetime_format: str) -> datetime:
+    """
+    Convert one date-time string into a naive ``datetime`` in UTC, with
+    ``datetime.strptime`` for the formats it knows without offset and
+    with up to 6 digits of fraction, else through ``parse_timestamps``:
+    ``%f`` may have up to 9 digits, the nanoseconds being truncated to the
+    microsecond.
+    """
+    if datetime_format in _FIXED_LAYOUTS and (
+            not datetime_format.endswith('%f')
+            or len(date_str) - date_str.rfind('.') <= 7):
+        return datetime.strptime(date_str, datetime_format)
+    nanoseconds = int(parse_timestamps(np.array([date_str.strip().encode()]),
+                                       datetime_format)[0])
+    return _EPOCH + timedelta(microseconds=nanoseconds // 1000)
+
+
+def parse_timestamps(raw: np.ndarray, datetime_format: str) -> np.ndarray:
+    """
+    Convert an array of date-time byte strings into int64 nanoseconds
+    since the epoch.
+    """
+    if datetime_format not in _DECODED_FORMATS:
+        raise ValueError(f'Date-time format of {raw[0]!r} not recognized.')
+    times, invalid = decode_timestamps(raw, datetime_format)
+    if invalid.any():
+        raise ValueError(f'Date-time {raw[np.argmax(invalid)]!r} '
+                         f'not matching the format {datetime_format}.')
+    return times
+
+
+def parse_rows(rows: np.ndarray, datetime_format: str) -> tuple:
+    """
+    Convert an array of rows 'date-time,value' given as bytes into the
+    couple of arrays (times, values).
+    """
+    table = np.char.partition(rows, b',')
+    times = parse_timestamps(np.char.strip(table[:, 0]), datetime_format)
+    values = np.char.strip(table[:, 2]).astype(np.float64)
+    return times, values
+
+
+def iter_lines_blocks(file, block_bytes: int):
+    """
+    Read an open binary file by blocks of about ``block_bytes`` bytes
+    and yield each block as an array of complete lines.
+    """
+    remainder = b''
+    while True:
+        block = file.read(block_bytes)
+        if not block:
+            break
+        block = remainder + block
+        cut = block.rfind(b'\n') + 1
+        block, remainder = block[:cut], block[cut:]
+        if block:
+            yield np.char.strip(np.array(block.split(b'\n')[:-1]))
+    if remainder:
+        yield np.char.strip(np.array([remainder]))
+
+
+# magic bytes at the start of the compressed files, with their opener
+_COMPRESSIONS = {
+    'gzip': (b'\x1f\x8b', gzip.open),
+    'bz2': (b'BZh', bz2.open),
+    'xz': (b'\xfd7zXZ\x00', lzma.open),
+}
+
+
+def detect_compression(filename: str) -> str:
+    """Return 'gzip', 'bz2' or 'xz' from the magic bytes of a file, or None."""
+    with open(filename, 'rb') as file:
+        head = file.read(8)
+    for name, (magic, _) in _COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class PrefetchReader(io.RawIOBase):
+    """
+    Binary stream reading another stream in a background thread, by
+    blocks kept in a bounded queue. For a compressed file, the
+    decompression is then done while the previous blocks are parsed.
+    """
+
+    def __init__(self, stream, block_bytes: int, blocks: int):
+        super().__init__()
+        self._stream = stream
+        self._queue = queue.Queue(maxsize=blocks)
+        self._pending = b''
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(block_bytes,),
+                                        daemon=True)
+        self._thread.start()
+
+    def _fill(self, block_bytes: int) -> None:
+        try:
+            while not self._stopped.is_set():
+                block = self._stream.read(block_bytes)
+                self._put(block)
+                if not block:
+                    break
+        except Exception as err:        # given back to the reading thread
+            self._put(err)
+
+    def _put(self, item) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            if self._thread is None:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._thread = None
+                return 0
+            self._pending = memoryview(item)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._stream.close()
+        super().close()
+
+
+def open_measures(filename: str, settings=reader_settings):
+    """
+    Open an input file as a binary stream. A file compressed with gzip,
+    bz2 or xz, detected by its magic bytes, is decompressed on the fly
+    in a background thread.
+    """
+    compression = detect_compression(filename)
+    if compression is None:
+        return open(filename, 'rb')
+    opener = _COMPRESSIONS[compression][1]
+    return io.BufferedReader(
+        PrefetchReader(opener(filename, 'rb'), settings['chunk_bytes'],
+                       settings['prefetch_blocks']),
+        buffer_size=settings['chunk_bytes'])
+
+
+class ParserState:
+    """
+    State of the parsing between two blocks of lines: the title of the
+    current set and its datetime format, and the datetime format inferred
+    for each set (the first one, for a set in several parts).
+    """
+    __slots__ = ('name', 'datetime_format', 'formats')
+
+    def __init__(self, formats: dict = None):
+        self.name = 'xxx'
+        self.datetime_format = None
+        self.formats = {} if formats is None else formats
+
+
+def parse_lines(lines: np.ndarray, state: ParserState):
+    """
+    Parse an array of complete lines, continuing the set of ``state``,
+    and yield the chunks (name, times, values) of the sets found.
+    """
+    is_row = np.char.find(lines, b',') >= 0
+    titles = np.flatnonzero(~is_row & (np.char.str_len(lines) > 0))
+    bounds = sorted({0, *titles.tolist(), len(lines)})
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if first in titles:
+            state.name = lines[first].decode()
+            state.datetime_format = None
+        rows = lines[first:last][is_row[first:last]]
+        if len(rows) == 0:
+            continue
+        if state.datetime_format is None:
+            state.datetime_format = infer_datetime_format(rows)
+            state.formats.setdefault(state.name, state.datetime_format)
+        yield (state.name, *parse_rows(rows, state.datetime_format))
+
+
+def detect_layout(first_line: bytes) -> str:
+    """
+    Layout of a file from its first line: 'wide' when it is a header, a
+    timestamp column followed by one column per set, else 'stacked' for
+    the sets one below each other (the first line being a title).
+    """
+    fields = first_line.strip().split(b',')
+    if len(fields) > 1 and detect_datetime_format(
+            fields[0].decode(errors='replace')) is None:
+        return 'wide'
+    return 'stacked'
+
+
+def file_layout(filename: str, settings=reader_settings) -> str:
+    """Layout ('wide' or 'stacked') of an input file, see ``detect_layout``."""
+    with open_measures(filename, settings) as file:
+        return detect_layout(file.readline())
+
+
+def parse_wide_lines(lines: np.ndarray, names: list, datetime_format: str):
+    """
+    Parse an array of rows 'date-time,value,value...' of a wide file and
+    yield the chunks (name, times, values) of all its columns, in the
+    order of the header, the empty cells being left out of the sets.
+    """
+    table = np.char.partition(lines, b',')
+    times = parse_timestamps(np.char.strip(table[:, 0]), datetime_format)
+    rest = table[:, 2]
+    for name in names:
+        table = np.char.partition(rest, b',')
+        cells, rest = np.char.strip(table[:, 0]), table[:, 2]
+        present = np.char.str_len(cells) > 0
+        yield name, times[present], cells[present].astype(np.float64)
+
+
+def iter_wide_measures(blocks, formats: dict = None):
+    """
+    Yield the chunks (name, times, values) of the blocks of lines of a
+    wide file, the first line being the header giving the names of the
+    sets. The datetime format is inferred on the rows of the first block,
+    and set for all the sets in ``formats`` when given.
+    """
+    names, datetime_format = None, None
+    for lines in blocks:
+        if names is None:
+            names = [n.strip().decode() for n in lines[0].split(b',')[1:]]
+            lines = lines[1:]
+        lines = lines[np.char.str_len(lines) > 0]
+        if len(lines) == 0:
+            continue
+        if datetime_format is None:
+            datetime_format = infer_datetime_format(lines)
+            if formats is not None:
+                formats.update(dict.fromkeys(names, datetime_format))
+        yield from parse_wide_lines(lines, names, datetime_format)
+
+
+def iter_measures(file, settings=reader_settings, formats: dict = None):
+    """
+    Read an open file containing sets of data one below each other and
+    yield the sets by chunks (name, times, values), a set longer than a
+    block being yielded in several chunks.
+
+    Only one block of ``settings['chunk_bytes']`` bytes and its arrays are
+    in memory at the same time. The datetime format of each set is
+    inferred on a sample of its first rows, and set in ``formats`` when
+    given. A wide file (see ``detect_layout``) is read column by column.
+    """
+    file = getattr(file, 'buffer', file)    # text files are read as bytes
+    blocks = iter_lines_blocks(file, settings['chunk_bytes'])
+    first = next(blocks, None)
+    if first is None:
+        return
+    blocks = itertools.chain([first], blocks)
+    if len(first) and detect_layout(first[0]) == 'wide':
+        yield from iter_wide_measures(blocks, formats)
+        return
+    state = ParserState(formats)
+    for lines in blocks:
+        yield from parse_lines(lines, state)
+
+
+def collect_measures(chunks, formats: dict = None) -> dict:
+    """
+    Gather the chunks (name, times, values) of a stream into the
+    dictionary of arrays, the chunks of a same set being concatenated.
+    ``formats`` gives the datetime format of the sets.
+    """
+    parts = {}
+    for name, times, values in chunks:
+        parts.setdefault(name, []).append((times, values))
+    result = MeasureSets((name, (np.concatenate([p[0] for p in part]),
+                                 np.concatenate([p[1] for p in part])))
+                         for name, part in parts.items())
+    if formats:
+        result.formats = {name: formats[name] for name in result if name in formats}
+    return result
+
+
+def read_measures_arrays(filename: str, settings=reader_settings) -> dict:
+    """
+    Read a filename containing sets of data one below each other
+    and return, for each set, the arrays of times and values.
+
+    The file is read by blocks of ``settings['chunk_bytes']`` bytes,
+    the rows of each block being converted with NumPy in a single
+    operation (see ``iter_measures``). The datetime format of each set is
+    kept in ``formats``.
+    """
+    formats = {}
+    with open_measures(filename, settings) as file:
+        return collect_measures(iter_measures(file, settings, formats), formats)
+
+
+def measure_pairs(times: np.ndarray, values: np.ndarray) -> list:
+    """
+    Convert the arrays of one set back into the list of couples
+    (datetime, value) returned by ``setsManagement.read_measures``.
+    """
+    dates = times.astype('datetime64[ns]').astype('datetime64[us]')
+    return list(zip(dates.tolist(), values.tolist()))
+
+
+@dataclass
+class SetIndexEntry:
+    """Position and characteristics of one set in the input file."""
+    name: str
+    start: int              # byte offset of the first row
+    end: int                # byte offset after the last row
+    rows: int = 0
+    first: int = None       # first, second and last times in ns
+    second: int = None
+    last: int = None
+    datetime_format: str = None
+
+
+def _iter_lines_positions(buffer, block_bytes: int):
+    """
+    Scan a memory-mapped file by blocks of complete lines and yield for
+    each block the arrays of the starts and ends of the lines, and the
+    masks of the rows (lines with a comma) and of the other lines.
+    """
+    size = len(buffer)
+    begin = 0
+    while begin < size:
+        stop = buffer.rfind(b'\n', begin, begin + block_bytes) + 1
+        if stop <= begin:
+            stop = buffer.find(b'\n', begin + block_bytes) + 1 or size
+        block = np.frombuffer(buffer, dtype=np.uint8,
+                              count=stop - begin, offset=begin)
+        ends = np.flatnonzero(block == ord('\n'))
+        if len(ends) == 0 or ends[-1] != len(block) - 1:
+            ends = np.append(ends, len(block))
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        commas = np.flatnonzero(block == ord(','))
+        is_row = (np.searchsorted(commas, starts)
+                  < np.searchsorted(commas, ends))
+        yield begin + starts, begin + ends, is_row
+        begin = stop
+
+
+def index_sets(filename: str, settings=reader_settings) -> list:
+    """
+    First pass on a memory-mapped file to locate the sets without
+    parsing their values: the result is the list of the ``SetIndexEntry``
+    in the order of the file, with the byte range of the rows of each set,
+    its number of rows and its first, second and last times.
+    A compressed file or a wide file cannot be indexed, it has to be
+    streamed.
+    """
+    if detect_compression(filename):
+        raise ValueError(f'Compressed file {filename} cannot be indexed.')
+    if file_layout(filename, settings) == 'wide':
+        raise ValueError(f'Wide file {filename} cannot be indexed.')
+    entries = []
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return entries
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            current = None
+            for starts, ends, is_row in _iter_lines_positions(
+                    buffer, settings['chunk_bytes']):
+                titles = np.flatnonzero(~is_row).tolist()
+                bounds = sorted({0, *titles, len(starts)})
+                for first, last in zip(bounds[:-1], bounds[1:]):
+                    if first in titles:
+                        name = buffer[starts[first]:ends[first]].strip()
+                        if not name:
+                            first += 1
+                        else:
+                            current = SetIndexEntry(name.decode(),
+                                                    int(ends[first]) + 1,
+                                                    int(ends[first]) + 1)
+                            entries.append(current)
+                    rows = np.flatnonzero(is_row[first:last]) + first
+                    if len(rows) == 0:
+                        continue
+                    if current is None:
+                        current = SetIndexEntry('xxx', int(starts[rows[0]]),
+                                                int(starts[rows[0]]))
+                        entries.append(current)
+                    if current.rows == 0:
+                        current.start = current.first = int(starts[rows[0]])
+                    if current.rows < 2 <= current.rows + len(rows):
+                        current.second = int(starts[rows[1 - current.rows]])
+                    current.last = int(starts[rows[-1]])
+                    current.end = int(ends[rows[-1]])
+                    current.rows += len(rows)
+
+            # only the first, second and last rows of each set are parsed
+            for entry in entries:
+                if entry.rows == 0:
+                    continue
+                if entry.second is None:
+                    entry.second = entry.first
+                positions = (entry.first, entry.second, entry.last)
+                raw = [buffer[p:buffer.find(b',', p)].strip() for p in positions]
+                entry.datetime_format = infer_datetime_format(np.array(raw))
+                entry.first, entry.second, entry.last = parse_timestamps(
+                    np.array(raw), entry.datetime_format).tolist()
+    return entries
+
+
+def parse_range(filename: str, start: int, end: int,
+                datetime_format: str) -> tuple:
+    """
+    Parse the rows found between the byte offsets ``start`` and ``end``
+    of a file, which shall be at line boundaries, into (times, values).
+    """
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        lines = np.char.strip(np.array(file.read(end - start).split(b'\n')))
+    return parse_rows(lines[np.char.find(lines, b',') >= 0], datetime_format)
+
+
+class LazySets(Mapping):
+    """
+    Sets of an input file loaded only when they are used.
+
+    The file is first indexed with ``index_sets``. A set is parsed when it
+    is accessed, as a couple of arrays (times, values), and kept for the
+    next accesses. The characteristics of the sets (first, second and last
+    times, number of rows) are available in ``index`` without loading.
+    """
+
+    def __init__(self, filename: str, settings=reader_settings):
+        self.filename = filename
+        self.index = {}
+        for entry in index_sets(filename, settings):
+            if entry.rows > 0:
+                self.index.setdefault(entry.name, []).append(entry)
+        self._loaded = {}
+        self.characteristics = None         # see sets_starts_ends_steps
+
+    def __getitem__(self, name: str) -> tuple:
+        if name not in self._loaded:
+            parts = [parse_range(self.filename, entry.start, entry.end,
+                                 entry.datetime_format)
+                     for entry in self.index[name]]
+            self._loaded[name] = (np.concatenate([p[0] for p in parts]),
+                                  np.concatenate([p[1] for p in parts]))
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def formats(self) -> dict:
+        """Datetime format of each set, from the index."""
+        return {name: entries[0].datetime_format
+                for name, entries in self.index.items()}
+
+    def is_loaded(self, name: str) -> bool:
+        """The set was already parsed."""
+        return name in self._loaded
+
+    def bounds(self, name: str) -> tuple:
+        """Return the first, second and last times of a set in ns."""
+        entries = self.index[name]
+        if entries[0].rows == 1 and len(entries) > 1:
+            return entries[0].first, entries[1].first, entries[-1].last
+        return entries[0].first, entries[0].second, entries[-1].last
+
+
+def split_ranges(filename: str, entries: list, split_bytes: int) -> list:
+    """
+    Split the byte ranges of the sets at line boundaries into blocks of
+    about ``split_bytes`` bytes. Return the list of the blocks as
+    (name, start, end, datetime_format) in the order of the file.
+    """
+    blocks = []
+    with open(filename, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        for entry in entries:
+            if entry.rows == 0:
+                continue
+            start = entry.start
+            while start < entry.end:
+                stop = buffer.find(b'\n', start + split_bytes, entry.end) + 1
+                if stop <= start:
+                    stop = entry.end
+                blocks.append((entry.name, start, stop, entry.datetime_format))
+                start = stop
+    return blocks
+
+
+def read_measures_parallel(filename: str, settings=reader_settings) -> dict:
+    """
+    Read a filename containing sets of data as ``read_measures_arrays``,
+    but with the parsing shared between ``settings['workers']`` processes.
+
+    The file is indexed first, then the sets are split at their bounds,
+    or at line boundaries inside a large set, into blocks parsed by a
+    ``ProcessPoolExecutor``. The arrays of the blocks are merged back in
+    the order of the file.
+    """
+    if detect_compression(filename) or file_layout(filename) == 'wide':
+        # no sets at byte offsets to split, the file is streamed
+        return read_measures_arrays(filename, settings)
+    entries = index_sets(filename, settings)
+    if not entries:
+        return {}
+    blocks = split_ranges(filename, entries, settings['split_bytes'])
+    with ProcessPoolExecutor(max_workers=settings['workers']) as executor:
+        results = executor.map(parse_range,
+                               *zip(*[(filename, *b[1:]) for b in blocks]))
+        return collect_measures(((block[0], *result)
+                                 for block, result in zip(blocks, results)),
+                                {entry.name: entry.datetime_format
+                                 for entry in reversed(entries) if entry.rows})
+
+
+def merge_measures(parts: list) -> dict:
+    """
+    Merge several dictionaries of arrays, the sets with the same title
+    being concatenated in time order. When the sets of several
+    dictionaries overlap in time, their rows are sorted by time. The
+    datetime formats of the sets are kept, the first one for a set in
+    several dictionaries.
+    """
+    pieces, formats = {}, {}
+    for data in parts:
+        for name, datetime_format in getattr(data, 'formats', {}).items():
+            formats.setdefault(name, datetime_format)
+        for name, (times, values) in data.items():
+            if len(times):
+                pieces.setdefault(name, []).append((times, values))
+    result = MeasureSets()
+    result.formats = {name: formats[name] for name in pieces if name in formats}
+    for name, piece in pieces.items():
+        piece.sort(key=lambda p: p[0][0])
+        times = np.concatenate([p[0] for p in piece])
+        values = np.concatenate([p[1] for p in piece])
+        if (np.diff(times) < 0).any():
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        result[name] = (times, values)
+    return result
+
+
+def read_measures_files(filenames, settings=reader_settings) -> dict:
+    """
+    Read several files, given as a list or as a glob pattern, with
+    ``read_measures_arrays`` in ``settings['workers']`` processes and
+    merge their sets with ``merge_measures``.
+    """
+    if isinstance(filenames, str):
+        filenames = sorted(glob.glob(filenames))
+    if not filenames:
+        return {}
+    with ProcessPoolExecutor(max_workers=settings['workers']) as executor:
+        parts = list(executor.map(read_measures_arrays, filenames,
+                                  [settings] * len(filenames)))
+    return merge_measures(parts)
+
+
+class TailReader:
+    """
+    Reader of a file still being appended by the acquisition. Each call
+    of ``update`` parses only the complete lines added since the previous
+    call, continuing the set and the datetime format where the previous
+    call stopped, and extends the arrays of the sets.
+    """
+
+    def __init__(self, filename: str, settings=reader_settings):
+        if detect_compression(filename):
+            raise ValueError(f'Compressed file {filename} cannot be followed.')
+        if file_layout(filename, settings) == 'wide':
+            raise ValueError(f'Wide file {filename} cannot be followed.')
+        self.filename = filename
+        self.settings = settings
+        self.offset = 0             # bytes already parsed
+        self.state = ParserState()
+        self._times = {}            # arrays with spare capacity
+        self._values = {}
+        self._lengths = {}
+        self._measures = None
+
+    @property
+    def measures(self) -> dict:
+        """
+        Dictionary of the arrays (times, values) read up to now, the same
+        one being returned until rows are appended.
+        """
+        if self._measures is None:
+            self._measures = MeasureSets(
+                (name, (self._times[name][:length], self._values[name][:length]))
+                for name, length in self._lengths.items())
+            self._measures.formats = dict(self.state.formats)
+        return self._measures
+
+    def update(self) -> dict:
+        """
+        Parse the lines appended since the last update and return the new
+        rows of each set as a dictionary of arrays. A file which became
+        shorter was rewritten, it is then read again from its start.
+        """
+        if os.path.getsize(self.filename) < self.offset:
+            self.__init__(self.filename, self.settings)
+        with open(self.filename, 'rb') as file:
+            file.seek(self.offset)
+            new_rows = collect_measures(self._read(file))
+        for name, (times, values) in new_rows.items():
+            self._extend(name, times, values)
+        return new_rows
+
+    def _read(self, file):
+        """Yield the chunks of the complete lines after the offset."""
+        while True:
+            block = file.read(self.settings['chunk_bytes'])
+            cut = block.rfind(b'\n') + 1
+            if cut == 0:
+                if len(block) == self.settings['chunk_bytes']:
+                    raise ValueError(f'Line longer than a block in {self.filename}.')
+                return              # an incomplete line is left for later
+            self.offset += cut
+            file.seek(self.offset)
+            lines = np.char.strip(np.array(block[:cut].split(b'\n')[:-1]))
+            yield from parse_lines(lines, self.state)
+
+    def _extend(self, name: str, times: np.ndarray, values: np.ndarray) -> None:
+        """Append rows to a set, doubling the capacity when it is full."""
+        length = self._lengths.get(name, 0)
+        needed = length + len(times)
+        if name not in self._times or needed > len(self._times[name]):
+            capacity = max(needed, 2 * length, 1024)
+            for store, dtype in ((self._times, np.int64), (self._values, np.float64)):
+                grown = np.empty(capacity, dtype=dtype)
+                if name in store:
+                    grown[:length] = store[name][:length]
+                store[name] = grown
+        self._times[name][length:needed] = times
+        self._values[name][length:needed] = values
+        self._lengths[name] = needed
+        self._measures = None
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import numpy as np
+
+from lib.measureSet import MeasureSet, measure_sets
+
+"""
+Sets of measures placed in shared memory for worker processes.
+
+Giving the sets to a worker process would pickle all their arrays. The
+arrays are instead copied once in a segment of ``multiprocessing``
+shared memory, with a small table describing where the arrays of each set
+are. Only this table is pickled for the workers, which attach the
+segment and read the arrays without copy.
+
+The process which created the segment owns it: the segment is removed
+when its ``SharedSets`` is unlinked, by the application when its sets
+change or when it is closed, or at the end of a ``with`` block.
+"""
+
+_ALIGN = 64
+
+
+@dataclass(frozen=True)
+class SharedSetDescriptor:
+    """Place of the arrays of a set in the shared segment."""
+    name: str
+    rows: int
+    times: int              # offset of the int64 times in the segment
+    values: int             # offset of the stored values in the segment
+    dtype: str              # dtype of the stored values (see pack_values)
+    decimals: int = None
+    step: int = None
+    datetime_format: str = None
+
+
+class SharedSets(Mapping):
+    """
+    Dictionary of ``MeasureSet`` whose arrays are views on a shared
+    memory segment. ``SharedSets.create`` copies the sets in a new segment
+    owned by the calling process; a ``SharedSets`` given to another
+    process (for instance as argument of a ``ProcessPoolExecutor``) is
+    pickled as its table and attaches the segment without owning it.
+    """
+
+    def __init__(self, segment: str, table: tuple, owner: bool = False):
+        self.table = tuple(table)
+        self.owner = owner
+        self._memory = shared_memory.SharedMemory(name=segment)
+        self._sets = {}
+        for entry in self.table:
+            times = np.frombuffer(self._memory.buf, dtype='<i8',
+                                  count=entry.rows, offset=entry.times)
+            packed = np.frombuffer(self._memory.buf, dtype=entry.dtype,
+                                   count=entry.rows, offset=entry.values)
+            self._sets[entry.name] = MeasureSet.from_packed(
+                entry.name, times, packed, entry.decimals, entry.step,
+                entry.datetime_format)
+
+    @classmethod
+    def create(cls, data: dict):
+        """
+        Copy the sets of a dictionary, in any form accepted by
+        ``measure_sets``, in a new shared segment owned by the caller.
+        """
+        sets = measure_sets(data, precision=None)
+        table, offset = [], 0
+        for name, entry in sets.items():
+            times = offset
+            offset += _aligned(entry.times.nbytes)
+            table.append(SharedSetDescriptor(
+                name, len(entry), times, offset, entry.packed.dtype.str,
+                entry.decimals, entry.step, entry.datetime_format))
+            offset += _aligned(entry.packed.nbytes)
+        memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for entry, stored in zip(table, sets.values()):
+                for start, array in ((entry.times, stored.times),
+                                     (entry.values, stored.packed)):
+                    memory.buf[start:start + array.nbytes] = array.tobytes()
+            return cls(memory.name, table, owner=True)
+        finally:
+            memory.close()      # the store holds its own handle
+
+    @property
+    def segment(self) -> str:
+        """Name of the shared memory segment."""
+        return self._memory.name
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the shared segment."""
+        return self._memory.size
+
+    def __reduce__(self):
+        return (SharedSets, (self.segment, self.table))
+
+    def __getitem__(self, name: str) -> MeasureSet:
+        return self._sets[name]
+
+    def __iter__(self):
+        return iter(self._sets)
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def close(self) -> None:
+        """
+        Release the views on the segment in this process, and remove the
+        segment when this process owns it. No array of the sets shall be
+        referenced anymore, else ``BufferError`` is raised (the segment
+        being still removed).
+        """
+        if self._memory is None:
+            return
+        memory, self._memory, self._sets = self._memory, None, {}
+        try:
+            memory.close()
+        finally:
+            if self.owner:
+                memory.unlink()
+
+    def __del__(self):
+        # an attached store releases its views before the segment handle
+        if getattr(self, '_memory', None) is not None and not self.owner:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _aligned(size: int) -> int:
+    """Size rounded up to the alignment of the arrays."""
+    return -(-size // _ALIGN) * _ALIGN
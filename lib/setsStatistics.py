@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import numpy as np
+from tabulate import tabulate
+
+from lib.measureSet import MeasureSet, RegularSeries, measure_arrays
+from lib.setsStore import ChunkedStore
+from lib.setsShared import SharedSets
+
+"""
+Statistics on the values of the sets.
+
+Before choosing the settings of the synchronization, the minimum, maximum,
+mean, standard deviation, quantiles and number of NaN of each set are
+needed. They are computed with NumPy on all the values of a set at once.
+
+The sets streamed chunk by chunk, as by ``setsReader.iter_measures`` or
+from a ``ChunkedStore``, are summed up in a ``StatisticsAccumulator``: the
+counts, extrema, mean and sum of squared deviations of the chunks are
+merged exactly, and the quantiles are estimated on a sketch of at most
+``sketch_size`` weighted values.
+
+The sets of a ``setsShared.SharedSets`` are given to ``workers`` processes
+by ``parallel_statistics``, each set being read in the shared segment.
+"""
+
+statistics_settings = {
+    'quantiles': (0.05, 0.25, 0.5, 0.75, 0.95),
+    'sketch_size': 4096,        # values kept to estimate the streamed quantiles
+    'stream_rows': 1 << 20,     # rows of a ChunkedStore added at once
+    'workers': None,            # processes of parallel_statistics (None: all cores)
+}
+
+
+@dataclass
+class SetStatistics:
+    """Statistics on the values of a set, NaN being left apart."""
+    name: str
+    rows: int = 0
+    nans: int = 0
+    min: float = np.nan
+    max: float = np.nan
+    mean: float = np.nan
+    std: float = np.nan
+    quantiles: dict = field(default_factory=dict)
+
+
+def set_statistics(name: str, values: np.ndarray,
+                   settings=statistics_settings) -> SetStatistics:
+    """Statistics on all the values of a set, the quantiles being exact."""
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    finite = values[~missing]
+    result = SetStatistics(name, len(values), int(missing.sum()))
+    if len(finite):
+        result.min, result.max = float(finite.min()), float(finite.max())
+        result.mean, result.std = float(finite.mean()), float(finite.std())
+        quantiles = np.quantile(finite, settings['quantiles'])
+        result.quantiles = dict(zip(settings['quantiles'], quantiles.tolist()))
+    return result
+
+
+class StatisticsAccumulator:
+    """
+    Statistics on a set given chunk by chunk. The chunks are added with
+    ``add`` and the statistics are read at any time with ``result``.
+    """
+
+    def __init__(self, name: str, settings=statistics_settings):
+        self.name = name
+        self.settings = settings
+        self.rows = 0
+        self.nans = 0
+        self.count = 0              # values which are not NaN
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.squares = 0.0          # sum of the squared deviations to the mean
+        self.sketch = np.empty(0)   # sorted values with their weights
+        self.weights = np.empty(0)
+
+    def add(self, values: np.ndarray) -> None:
+        """Merge the statistics of a chunk of values."""
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        finite = values[~missing]
+        self.rows += len(values)
+        self.nans += int(missing.sum())
+        if len(finite) == 0:
+            return
+        count, mean = len(finite), finite.mean()
+        total = self.count + count
+        delta = mean - self.mean
+        self.squares += (((finite - mean) ** 2).sum()
+                         + delta ** 2 * self.count * count / total)
+        self.mean += delta * count / total
+        self.count = total
+        self.min, self.max = min(self.min, finite.min()), max(self.max, finite.max())
+        self._merge_sketch(finite)
+
+    def _merge_sketch(self, values: np.ndarray) -> None:
+        """
+        Merge the values in the sketch and, above its size, keep one value
+        per interval of equal total weight.
+        """
+        sketch = np.concatenate((self.sketch, values))
+        weights = np.concatenate((self.weights, np.ones(len(values))))
+        order = np.argsort(sketch, kind='stable')
+        sketch, weights = sketch[order], weights[order]
+        size = self.settings['sketch_size']
+        if len(sketch) > size:
+            cumulated = np.cumsum(weights)
+            bounds = np.searchsorted(cumulated, np.linspace(0, cumulated[-1], size + 1)[1:],
+                                     side='left')
+            bounds = np.unique(np.minimum(bounds, len(sketch) - 1))
+            kept = np.diff(np.concatenate(([0.0], cumulated[bounds])))
+            sketch, weights = sketch[bounds], kept
+        self.sketch, self.weights = sketch, weights
+
+    def result(self) -> SetStatistics:
+        """Statistics on the values added up to now."""
+        result = SetStatistics(self.name, self.rows, self.nans)
+        if self.count:
+            result.min, result.max = float(self.min), float(self.max)
+            result.mean = float(self.mean)
+            result.std = float(np.sqrt(self.squares / self.count))
+            # rank of each weighted value at the middle of its interval, as
+            # numpy.quantile when the values are all kept
+            ranks = np.cumsum(self.weights) - (self.weights + 1) / 2
+            quantiles = np.interp(np.array(self.settings['quantiles']) * (self.count - 1),
+                                  ranks, self.sketch)
+            result.quantiles = dict(zip(self.settings['quantiles'], quantiles.tolist()))
+        return result
+
+
+def stream_statistics(chunks, settings=statistics_settings) -> dict:
+    """
+    Statistics on the sets of a stream of chunks (name, times, values),
+    as given by ``setsReader.iter_measures``.
+    """
+    accumulators = {}
+    for name, _, values in chunks:
+        if name not in accumulators:
+            accumulators[name] = StatisticsAccumulator(name, settings)
+        accumulators[name].add(values)
+    return {name: accumulator.result() for name, accumulator in accumulators.items()}
+
+
+def sets_statistics(data, settings=statistics_settings) -> dict:
+    """
+    Statistics on each set of a dictionary, in any of the forms of
+    ``measureSet.measure_arrays``. The memory-mapped sets of a
+    ``ChunkedStore`` are streamed by blocks of ``settings['stream_rows']``
+    rows, and a stream of chunks is also accepted.
+    """
+    if not isinstance(data, Mapping):
+        return stream_statistics(data, settings)
+    result = {}
+    for name, entry in data.items():
+        if isinstance(data, ChunkedStore):
+            accumulator = StatisticsAccumulator(name, settings)
+            values = entry[1]
+            for first in range(0, len(values), settings['stream_rows']):
+                accumulator.add(values[first:first + settings['stream_rows']])
+            result[name] = accumulator.result()
+        elif isinstance(entry, (MeasureSet, RegularSeries)):
+            result[name] = set_statistics(name, entry.values, settings)
+        else:
+            result[name] = set_statistics(name, measure_arrays(entry)[1], settings)
+    return result
+
+
+def _shared_statistics(shared: SharedSets, name: str, settings: dict) -> SetStatistics:
+    """Statistics of a shared set, computed by a worker process."""
+    return set_statistics(name, shared[name].values, settings)
+
+
+def parallel_statistics(shared: SharedSets, settings=statistics_settings) -> dict:
+    """
+    Statistics on each set of a ``SharedSets``, computed by
+    ``settings['workers']`` processes: only the table of the segment is
+    pickled for each set, the workers reading its values without copy.
+    """
+    names = list(shared)
+    with ProcessPoolExecutor(max_workers=settings['workers']) as executor:
+        results = executor.map(_shared_statistics, [shared] * len(names), names,
+                               [settings] * len(names))
+        return dict(zip(names, results))
+
+
+def statistics_report(statistics: dict) -> str:
+    """Statistics of the sets as a table in a string."""
+    quantiles = sorted({q for s in statistics.values() for q in s.quantiles})
+    headers = (['set', 'rows', 'NaN', 'min', 'max', 'mean', 'std']
+               + [f'q{100 * q:g}' for q in quantiles])
+    rows = [[s.name, s.rows, s.nans, s.min, s.max, s.mean, s.std]
+            + [s.quantiles.get(q, np.nan) for q in quantiles]
+            for s in statistics.values()]
+    return tabulate(rows, headers=headers, floatfmt='.4g')
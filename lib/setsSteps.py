@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+from dataclasses import dataclass, field
+import numpy as np
+
+from lib.measureSet import MeasureSet, RegularSeries, measure_arrays
+
+"""
+Exact check of the time steps of the sets.
+
+The steps of a set are the differences of its int64 times, computed at
+once with NumPy, so that all the steps of millions of rows are checked in
+a few milliseconds. The nominal step is the most frequent positive step,
+and each step differing from it is classified:
+- a gap when it is at least ``gap_factor`` times the nominal step (one
+  measure or more is missing) ;
+- a jitter when it is positive but smaller, the time being shifted ;
+- a duplicate when it is null, an out-of-order time when it is negative.
+
+A set with gaps is still made of regular runs. The ``SegmentIndex`` of a
+set lists its maximal runs with a constant step, as (start, step, offset,
+length), so that the row of a time is computed arithmetically inside its
+run, the times between two runs being in a gap.
+"""
+
+step_settings = {
+    'gap_factor': 1.5,          # steps from this multiple of the nominal are gaps
+}
+
+
+@dataclass
+class StepReport:
+    """
+    Time steps of a set. The positions are the rows before the step, the
+    steps and jitter are in nanoseconds.
+    """
+    name: str
+    rows: int
+    step: int = None                    # nominal step
+    deviations: int = 0                 # steps differing from the nominal
+    max_jitter: int = 0                 # largest shift of the other steps
+    gaps: np.ndarray = field(default_factory=lambda: np.empty(0, np.int64))
+    gap_steps: np.ndarray = field(default_factory=lambda: np.empty(0, np.int64))
+    duplicates: np.ndarray = field(default_factory=lambda: np.empty(0, np.int64))
+    out_of_order: np.ndarray = field(default_factory=lambda: np.empty(0, np.int64))
+
+    @property
+    def regular(self) -> bool:
+        """The set has a constant time step."""
+        return self.step is not None and self.deviations == 0
+
+    @property
+    def gaps_only(self) -> bool:
+        """The set is made of regular runs separated by gaps."""
+        return self.step is not None and self.deviations == len(self.gaps)
+
+    def summary(self) -> str:
+        """Report as a single line."""
+        if self.step is None:
+            return f'{self.name}: {self.rows} rows, no time step'
+        if self.regular:
+            return f'{self.name}: constant step of {self.step / 1e9}s'
+        return (f'{self.name}: step of {self.step / 1e9}s, {self.deviations} '
+                f'steps deviating, jitter up to {self.max_jitter / 1e9}s, '
+                f'{len(self.gaps)} gaps, {len(self.duplicates)} duplicates, '
+                f'{len(self.out_of_order)} out of order')
+
+
+def step_report(name: str, times: np.ndarray, settings=step_settings) -> StepReport:
+    """Check all the time steps of a set given by its int64 times."""
+    report = StepReport(name, len(times))
+    steps = np.diff(np.asarray(times, dtype=np.int64))
+    positive = steps[steps > 0]
+    if len(positive) == 0:
+        report.duplicates = np.flatnonzero(steps == 0)
+        report.out_of_order = np.flatnonzero(steps < 0)
+        report.deviations = len(steps)
+        return report
+    if (steps == steps[0]).all():
+        report.step = int(steps[0])
+        return report
+
+    values, counts = np.unique(positive, return_counts=True)
+    report.step = step = int(values[np.argmax(counts)])
+    deviating = steps != step
+    report.deviations = int(deviating.sum())
+    is_gap = steps >= settings['gap_factor'] * step
+    report.gaps = np.flatnonzero(is_gap)
+    report.gap_steps = steps[report.gaps]
+    report.duplicates = np.flatnonzero(steps == 0)
+    report.out_of_order = np.flatnonzero(steps < 0)
+    jitter = steps[deviating & ~is_gap & (steps > 0)]
+    report.max_jitter = int(np.abs(jitter - step).max(initial=0))
+    return report
+
+
+def steps_report(data: dict, settings=step_settings) -> dict:
+    """
+    Report on the time steps of each set of a dictionary, the sets being
+    given in any of the forms of ``measureSet.measure_arrays``. The sets
+    with a known constant step are not checked again.
+    """
+    result = {}
+    for name, entry in data.items():
+        if isinstance(entry, RegularSeries) or (
+                isinstance(entry, MeasureSet) and entry.step is not None):
+            result[name] = StepReport(name, len(entry), entry.step)
+        else:
+            result[name] = step_report(name, measure_arrays(entry)[0], settings)
+    return result
+
+
+class SegmentIndex:
+    """
+    Maximal regular runs of a set: the run ``i`` holds the rows
+    ``offsets[i]`` to ``offsets[i] + lengths[i] - 1``, at the times
+    ``starts[i] + k * steps[i]``. The times are in nanoseconds, the step
+    of a run of a single row is 0.
+    """
+    __slots__ = ('starts', 'steps', 'offsets', 'lengths')
+
+    def __init__(self, starts: np.ndarray, steps: np.ndarray,
+                 offsets: np.ndarray, lengths: np.ndarray):
+        self.starts, self.steps = starts, steps
+        self.offsets, self.lengths = offsets, lengths
+
+    @classmethod
+    def from_times(cls, times: np.ndarray):
+        """
+        Segment the increasing int64 times of a set into its maximal runs
+        of equal steps. A step differing from both its neighbours (a gap, a
+        jitter) is between two runs, as a null or negative step. When two
+        runs with different steps follow each other, the row between them
+        is kept in the first one.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        steps = np.diff(times)
+        bad = steps <= 0
+        same = np.zeros(len(steps), dtype=bool)
+        same[1:] = (steps[1:] == steps[:-1]) & ~bad[1:]
+        next_same = np.append(same[1:], False)
+        taken = np.insert(same[:-1], 0, False) if len(steps) else same
+        # a step is in the run of its first row when it repeats the previous
+        # step, or when it starts a run on a row not taken by the previous run
+        linked = same | (next_same & ~taken)
+        if len(steps) == 1:
+            linked = ~bad
+
+        offsets = np.concatenate(([0], np.flatnonzero(~linked) + 1)).astype(np.int64)
+        lengths = np.diff(np.append(offsets, len(times)))
+        if len(times) == 0:
+            offsets, lengths = offsets[:0], lengths[:0]
+        run_steps = np.zeros(len(offsets), dtype=np.int64)
+        run_steps[lengths > 1] = steps[offsets[lengths > 1]]
+        return cls(times[offsets], run_steps, offsets, lengths)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __repr__(self) -> str:
+        return f'SegmentIndex(segments={len(self)}, step={self.step})'
+
+    @property
+    def segments(self) -> list:
+        """Runs as a list of tuples (start, step, offset, length)."""
+        return list(zip(self.starts.tolist(), self.steps.tolist(),
+                        self.offsets.tolist(), self.lengths.tolist()))
+
+    @property
+    def ends(self) -> np.ndarray:
+        """Time of the last row of each run."""
+        return self.starts + (self.lengths - 1) * self.steps
+
+    @property
+    def step(self) -> int:
+        """Nominal step: the step of the runs holding the most rows."""
+        regular = self.lengths > 1
+        if not regular.any():
+            return None
+        values, inverse = np.unique(self.steps[regular], return_inverse=True)
+        rows = np.bincount(inverse, weights=self.lengths[regular])
+        return int(values[np.argmax(rows)])
+
+    def locate(self, times) -> tuple:
+        """
+        Row of the last time at or before each time, computed
+        arithmetically in its run (-1 before the first row), and the mask
+        of the times in a gap, after the last row of a run and before the
+        first row of the next one.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        run = np.searchsorted(self.starts, times, side='right') - 1
+        inside = np.maximum(run, 0)
+        steps = np.maximum(self.steps[inside], 1)
+        position = np.minimum((times - self.starts[inside]) // steps,
+                              self.lengths[inside] - 1)
+        rows = np.where(run >= 0, self.offsets[inside] + position, -1)
+        gap = (run >= 0) & (run < len(self) - 1) & (times > self.ends[inside])
+        return rows, gap
+
+
+def set_segments(entry) -> SegmentIndex:
+    """
+    Segment index of a set given in any of the forms of
+    ``measureSet.measure_arrays``, a single run for the sets with a
+    known constant step.
+    """
+    if isinstance(entry, RegularSeries) or (
+            isinstance(entry, MeasureSet) and entry.step is not None):
+        start = entry.start if isinstance(entry, RegularSeries) else entry.times[0]
+        return SegmentIndex(np.array([start], dtype=np.int64),
+                            np.array([entry.step], dtype=np.int64),
+                            np.zeros(1, dtype=np.int64),
+                            np.array([len(entry)], dtype=np.int64))
+    return SegmentIndex.from_times(measure_arrays(entry)[0])
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+from collections.abc import Mapping
+import hashlib
+import json
+import os
+import numpy as np
+
+from lib.setsReader import read_measures_arrays, iter_measures, open_measures
+from lib.setsReader import reader_settings
+from lib.measureSet import MeasureSets, measure_arrays, set_formats
+
+"""
+Storage of the parsed sets outside of the text files.
+
+The parsed arrays of an input file are written in a binary cache file,
+which is memory-mapped when the same input is opened again, instead of
+parsing the text once more.
+
+The cache file is made of:
+- a magic string and the length of the header ;
+- a header in JSON giving for each set its name, its number of rows,
+  its datetime format and the offsets of its arrays of times and values ;
+- the arrays themselves, each one aligned on 64 bytes.
+
+Sets larger than the memory are written while streaming in a
+``ChunkedStore``: a directory with the times and values of each set in
+two files, cut in chunks of a fixed duration, and an index of the first
+row of each chunk. The sets are memory-mapped, and a time window of all
+the sets is read through the index of chunks.
+"""
+
+cache_settings = {
+    # directory of the cache files, None to write them next to the inputs
+    'directory': os.path.join(os.path.expanduser('~'), '.cache', 'syncreadings'),
+    'max_bytes': 4 << 30,       # size of the directory before eviction
+    'hash_bytes': 1 << 20,      # bytes hashed at the head and tail of inputs
+}
+
+chunk_settings = {
+    'chunk_seconds': 60,        # duration of the chunks of the sets
+}
+
+_MAGIC = b'SYNCRD01'
+_INDEX = 'index.json'
+_SUFFIX = '.srcache'
+_ALIGN = 64
+
+
+def cache_key(filename: str, settings=cache_settings) -> str:
+    """
+    Key of the cache of an input file, made of its size, its time of
+    modification and a hash of its content. To stay fast on large files,
+    only the first and last ``settings['hash_bytes']`` bytes are hashed.
+    """
+    stat = os.stat(filename)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    with open(filename, 'rb') as file:
+        digest.update(file.read(settings['hash_bytes']))
+        if stat.st_size > 2 * settings['hash_bytes']:
+            file.seek(-settings['hash_bytes'], os.SEEK_END)
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def cache_path(filename: str, settings=cache_settings) -> str:
+    """Path of the cache file of an input file."""
+    if settings['directory'] is None:
+        return filename + _SUFFIX
+    return os.path.join(settings['directory'],
+                        cache_key(filename, settings) + _SUFFIX)
+
+
+def write_cache(filename: str, data: dict, settings=cache_settings) -> str:
+    """
+    Write the sets of an input file in its cache file and evict the
+    least recently used cache files above ``settings['max_bytes']``.
+    """
+    path = cache_path(filename, settings)
+    arrays = {name: measure_arrays(entry) for name, entry in data.items()}
+    formats = set_formats(data)
+    header = {'key': cache_key(filename, settings), 'sets': []}
+    offset = 0
+    for name, (times, values) in arrays.items():
+        header['sets'].append({'name': name, 'rows': len(times),
+                               'datetime_format': formats.get(name),
+                               'times': offset,
+                               'values': offset + _aligned(times.nbytes)})
+        offset += _aligned(times.nbytes) + _aligned(values.nbytes)
+    text = json.dumps(header).encode()
+    start = _aligned(len(_MAGIC) + 8 + len(text))
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(_MAGIC + len(text).to_bytes(8, 'little') + text)
+        for entry, (times, values) in zip(header['sets'], arrays.values()):
+            for key, array, dtype in (('times', times, '<i8'),
+                                      ('values', values, '<f8')):
+                file.seek(start + entry[key])
+                file.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        file.truncate(start + offset)
+    os.replace(path + '.tmp', path)
+    evict_cache(settings)
+    return path
+
+
+def read_cache(filename: str, settings=cache_settings) -> dict:
+    """
+    Return the sets of an input file memory-mapped from its cache file,
+    or None when there is no valid cache for the current input.
+    """
+    path = cache_path(filename, settings)
+    if not os.path.exists(path):
+        return None
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(buffer[:len(_MAGIC)]) != _MAGIC:
+        return None
+    length = int.from_bytes(bytes(buffer[len(_MAGIC):len(_MAGIC) + 8]), 'little')
+    header = json.loads(bytes(buffer[len(_MAGIC) + 8:len(_MAGIC) + 8 + length]))
+    if header['key'] != cache_key(filename, settings):
+        return None
+    start = _aligned(len(_MAGIC) + 8 + length)
+    os.utime(path)      # the time of modification marks the last use
+    data = MeasureSets()
+    for entry in header['sets']:
+        rows = entry['rows']
+        times = buffer[start + entry['times']:][:8 * rows].view('<i8')
+        values = buffer[start + entry['values']:][:8 * rows].view('<f8')
+        data[entry['name']] = (times, values)
+        data.formats[entry['name']] = entry.get('datetime_format')
+    return data
+
+
+def evict_cache(settings=cache_settings) -> None:
+    """Remove the least recently used cache files above the size limit."""
+    if settings['directory'] is None:
+        return
+    entries = [e for e in os.scandir(settings['directory'])
+               if e.name.endswith(_SUFFIX)]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    total = 0
+    for entry in entries:
+        total += entry.stat().st_size
+        if total > settings['max_bytes']:
+            os.remove(entry.path)
+
+
+def load_measures(filename: str, settings=cache_settings,
+                  reader=read_measures_arrays) -> dict:
+    """
+    Read the sets of an input file from its cache, or with ``reader``
+    when there is no cache yet, the cache being then written.
+    """
+    data = read_cache(filename, settings)
+    if data is None:
+        data = reader(filename)
+        write_cache(filename, data, settings)
+    return data
+
+
+class ChunkedStore(Mapping):
+    """
+    Sets of measures kept on disk in a directory, each set as a file of
+    int64 times and a file of float64 values, cut in chunks of
+    ``chunk_ns`` nanoseconds since the epoch. For each set, the index
+    gives the numbers of its chunks and the first row of each one.
+
+    An entry is the couple of arrays (times, values) memory-mapped, so
+    that only the rows used are read from the disk, and ``window`` gives
+    the rows of a time interval found through the index of chunks.
+    ``formats`` gives the datetime format of each set in the input file.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, _INDEX)) as file:
+            header = json.load(file)
+        self.chunk_ns = header['chunk_ns']
+        self.index = {entry['name']: entry for entry in header['sets']}
+        self.formats = {name: entry.get('datetime_format')
+                        for name, entry in self.index.items()}
+        for entry in self.index.values():
+            entry['chunks'] = np.array(entry['chunks'], dtype=np.int64)
+            entry['rows'] = np.array(entry['rows'], dtype=np.int64)
+        self.characteristics = None         # see sets_starts_ends_steps
+
+    def __getitem__(self, name: str) -> tuple:
+        entry = self.index[name]
+        if entry['rows'][-1] == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float64)
+        path = os.path.join(self.directory, entry['file'])
+        return (np.memmap(path + '.times', dtype='<i8', mode='r'),
+                np.memmap(path + '.values', dtype='<f8', mode='r'))
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def window(self, name: str, start: int, end: int, margin: int = 2) -> tuple:
+        """
+        Copy of the rows of a set with a time in [start, end) (in
+        nanoseconds), with ``margin`` rows before and after. Only the
+        chunks of the interval are read.
+        """
+        entry = self.index[name]
+        chunks, rows = entry['chunks'], entry['rows']
+        first = np.searchsorted(chunks, start // self.chunk_ns, side='right') - 1
+        last = np.searchsorted(chunks, (end - 1) // self.chunk_ns, side='right')
+        low, high = rows[max(first, 0)], rows[min(last, len(chunks))]
+        times, values = self[name]
+        low += np.searchsorted(times[low:high], start)
+        high = low + np.searchsorted(times[low:high], end)
+        low, high = max(low - margin, 0), min(high + margin, len(times))
+        return np.array(times[low:high]), np.array(values[low:high])
+
+
+def write_chunked(filename: str, directory: str, settings=chunk_settings,
+                  reader=reader_settings) -> ChunkedStore:
+    """
+    Read an input file while streaming (see ``setsReader.iter_measures``)
+    and append its sets to a ``ChunkedStore`` in ``directory``, so that
+    only one block of the file is in memory. The times of each set shall
+    increase along the file.
+    """
+    chunk_ns = int(settings['chunk_seconds'] * 1e9)
+    index, last, formats = {}, {}, {}
+    os.makedirs(directory, exist_ok=True)
+    with open_measures(filename, reader) as file:
+        for name, times, values in iter_measures(file, reader, formats):
+            if name not in index:
+                index[name] = {'name': name, 'file': f'set{len(index):05d}',
+                               'chunks': [], 'rows': [0]}
+                for suffix in ('.times', '.values'):
+                    open(os.path.join(directory, index[name]['file'] + suffix),
+                         'wb').close()
+            entry = index[name]
+            if len(times) == 0:
+                continue
+            if (np.diff(times) < 0).any() or (
+                    times[0] < last.get(name, times[0])):
+                raise ValueError(f'Times of set {name} are not increasing.')
+            # a chunk starts at each change of the number of the chunk
+            numbers = times // chunk_ns
+            previous = entry['chunks'][-1] if entry['chunks'] else numbers[0] - 1
+            starts = np.flatnonzero(np.diff(numbers, prepend=previous))
+            count = entry['rows'].pop()
+            entry['chunks'] += numbers[starts].tolist()
+            entry['rows'] += (count + starts).tolist() + [count + len(times)]
+            path = os.path.join(directory, entry['file'])
+            with open(path + '.times', 'ab') as file_times:
+                file_times.write(np.ascontiguousarray(times, '<i8').tobytes())
+            with open(path + '.values', 'ab') as file_values:
+                file_values.write(np.ascontiguousarray(values, '<f8').tobytes())
+            last[name] = times[-1]
+    for name, entry in index.items():
+        entry['datetime_format'] = formats.get(name)
+    with open(os.path.join(directory, _INDEX), 'w') as file:
+        json.dump({'chunk_ns': chunk_ns, 'sets': list(index.values())}, file)
+    return ChunkedStore(directory)
+
+
+def _aligned(size: int) -> int:
+    """Size rounded up to the alignment of the arrays."""
+    return -(-size // _ALIGN) * _ALIGN
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+from lib.setsReader import ParserState, decode_timestamps, infer_datetime_format
+from lib.setsReader import iter_lines_blocks, open_measures, detect_layout
+
+"""
+Validation of the input files without any dialog.
+
+The input file is read by blocks as in ``setsReader``, and the rows of each
+block are checked in bulk with NumPy: the date-time shall match the format
+inferred on a few rows of its set, and the value shall be a number. The
+invalid rows are collected in a ``ValidationReport``, giving their line in
+the file and the number of invalid rows of each set, so that a single
+message can be shown by the application.
+"""
+
+validation_settings = {
+    'chunk_bytes': 1 << 22,     # size of the blocks checked at once
+    'max_errors': 1000,         # invalid rows before aborting the validation
+}
+
+# values accepted by float() which are not written as numbers
+_NAN_TEXTS = (b'nan', b'+nan', b'-nan')
+
+
+@dataclass
+class RowError:
+    """Invalid row of an input file."""
+    line: int           # number of the line in the file, from 1
+    name: str           # title of the set of the row
+    text: str           # content of the line
+    reason: str
+
+
+@dataclass
+class ValidationReport:
+    """
+    Result of the validation of an input file: number of rows and of
+    invalid rows of each set, and the invalid rows themselves. When the
+    number of invalid rows exceeds the budget, the validation stops at
+    the line ``lines`` and ``aborted`` is set.
+    """
+    filename: str
+    rows: dict = field(default_factory=dict)
+    invalid: dict = field(default_factory=dict)
+    errors: list = field(default_factory=list)
+    lines: int = 0
+    aborted: bool = False
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def summary(self, max_rows: int = 10) -> str:
+        """Report as a string (on several lines) for a single message."""
+        result = f'{sum(self.invalid.values())} invalid rows in {self.filename}'
+        if self.aborted:
+            result += f', validation aborted at line {self.lines}'
+        result += '\n'
+        for name, count in self.invalid.items():
+            if count:
+                result += f'    {name}: {count} invalid rows over {self.rows[name]}\n'
+        for error in self.errors[:max_rows]:
+            result += f'line {error.line} ({error.reason}): {error.text}\n'
+        if len(self.errors) > max_rows:
+            result += '...\n'
+        return result
+
+
+def invalid_values(values: np.ndarray) -> np.ndarray:
+    """
+    Mask of the byte strings of an array which are not numbers. The
+    array is converted at once, the values are only checked one by one
+    (by pandas) when the conversion fails.
+    """
+    try:
+        values.astype(np.float64)
+        return np.zeros(len(values), dtype=bool)
+    except ValueError:
+        texts = pd.Series(np.char.decode(values, errors='replace'))
+        numbers = pd.to_numeric(texts, errors='coerce')
+        return (numbers.isna().to_numpy()
+                & ~np.isin(np.char.lower(values), _NAN_TEXTS))
+
+
+def validate_lines(lines: np.ndarray, state: ParserState, first_line: int,
+                   report: ValidationReport, max_errors: int) -> None:
+    """
+    Check an array of complete lines starting at the line ``first_line``
+    of the file, continuing the set of ``state``, and add the invalid
+    rows to the report (at most ``max_errors`` rows are kept).
+    """
+    is_row = np.char.find(lines, b',') >= 0
+    titles = np.flatnonzero(~is_row & (np.char.str_len(lines) > 0))
+    bounds = sorted({0, *titles.tolist(), len(lines)})
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if first in titles:
+            state.name = lines[first].decode()
+            state.datetime_format = None
+        positions = first + np.flatnonzero(is_row[first:last])
+        if len(positions) == 0:
+            continue
+        table = np.char.partition(lines[positions], b',')
+        dates = np.char.strip(table[:, 0])
+        if state.datetime_format is None:
+            state.datetime_format = infer_datetime_format(dates)
+        if state.datetime_format is None:
+            bad_dates = np.ones(len(dates), dtype=bool)
+        else:
+            bad_dates = decode_timestamps(dates, state.datetime_format)[1]
+        bad_values = invalid_values(np.char.strip(table[:, 2]))
+
+        bad = bad_dates | bad_values
+        report.rows[state.name] = report.rows.get(state.name, 0) + len(positions)
+        report.invalid[state.name] = report.invalid.get(state.name, 0) + int(bad.sum())
+        for i in np.flatnonzero(bad)[:max(max_errors - len(report.errors), 0)]:
+            report.errors.append(RowError(
+                line=first_line + int(positions[i]) + 1,
+                name=state.name,
+                text=lines[positions[i]].decode(errors='replace'),
+                reason='date-time' if bad_dates[i] else 'value'))
+
+
+def validate_wide_lines(lines: np.ndarray, names: list, datetime_format: str,
+                        first_line: int, report: ValidationReport,
+                        max_errors: int) -> None:
+    """
+    Check an array of rows of a wide file starting at the line
+    ``first_line``, column by column, and add the invalid cells to the
+    report. An invalid date-time is counted on the first set.
+    """
+    positions = np.flatnonzero(np.char.str_len(lines) > 0)
+    table = np.char.partition(lines[positions], b',')
+    if datetime_format is None:
+        bad_dates = np.ones(len(positions), dtype=bool)
+    else:
+        bad_dates = decode_timestamps(np.char.strip(table[:, 0]),
+                                      datetime_format)[1]
+    rest = table[:, 2]
+    bad_values = np.zeros((len(names), len(positions)), dtype=bool)
+    for column, name in enumerate(names):
+        table = np.char.partition(rest, b',')
+        cells, rest = np.char.strip(table[:, 0]), table[:, 2]
+        present = np.char.str_len(cells) > 0
+        bad_values[column] = present & invalid_values(np.where(present, cells, b'0'))
+        bad = bad_values[column] | (bad_dates if column == 0 else False)
+        report.rows[name] = report.rows.get(name, 0) + int(present.sum())
+        report.invalid[name] = report.invalid.get(name, 0) + int(bad.sum())
+
+    bad = bad_dates | bad_values.any(axis=0)
+    for i in np.flatnonzero(bad)[:max(max_errors - len(report.errors), 0)]:
+        report.errors.append(RowError(
+            line=first_line + int(positions[i]) + 1,
+            name=names[int(np.argmax(bad_values[:, i]))],
+            text=lines[positions[i]].decode(errors='replace'),
+            reason='date-time' if bad_dates[i] else 'value'))
+
+
+def validate_measures(filename: str, settings=validation_settings) -> ValidationReport:
+    """
+    Check all the rows of an input file, stacked or wide (see
+    ``setsReader.detect_layout``), in a single pass and return the
+    report of the invalid rows. The validation stops at the end of the
+    block where more than ``settings['max_errors']`` invalid rows were
+    found.
+    """
+    report = ValidationReport(filename)
+    state = ParserState()
+    names = None
+    with open_measures(filename) as file:
+        blocks = iter_lines_blocks(file, settings['chunk_bytes'])
+        for block, lines in enumerate(blocks):
+            first_line = report.lines
+            report.lines += len(lines)
+            if block == 0 and len(lines) and detect_layout(lines[0]) == 'wide':
+                names = [n.strip().decode() for n in lines[0].split(b',')[1:]]
+                lines, first_line = lines[1:], 1
+            if names is None:
+                validate_lines(lines, state, first_line, report,
+                               settings['max_errors'])
+            else:
+                rows = lines[np.char.str_len(lines) > 0]
+                if state.datetime_format is None:
+                    state.datetime_format = infer_datetime_format(rows)
+                validate_wide_lines(lines, names, state.datetime_format,
+                                    first_line, report, settings['max_errors'])
+            if sum(report.invalid.values()) > settings['max_errors']:
+                report.aborted = True
+                break
+    return report
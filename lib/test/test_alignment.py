@@ -0,0 +1,228 @@
+import pytest
+
+'''
+Checks of the vectorized alignment of the sets, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+import math
+import statistics
+import numpy as np
+import pandas as pd
+
+from lib.setsManagement import synchronized_sets, synchronized_loop
+from lib.setsManagement import default_choices, mean_value
+from lib.setsReader import read_measures_arrays
+from lib.setsAlignment import round_values, align_set, grid_ticks
+from lib.setsAlignment import reducers, register_reducer
+from lib.setsAlignment import interpolations, solve_tridiagonal
+
+
+@pytest.fixture(params=["data.csv", "data_ms.csv"])
+def FILENAME(request):
+    return os.path.abspath(os.path.join(DAT_DIR, request.param))
+
+
+@pytest.mark.parametrize("STEP", ["gcd", "min", "max", "lcm", "1s", "700ms", "3s"])
+def test_same_as_loop(FILENAME, STEP) -> None:
+    '''The aligned table is the one of the reference loop'''
+    _arrays = read_measures_arrays(FILENAME)
+    _choice = dict(default_choices, step=STEP)
+    _table = synchronized_sets(_arrays, _choice)
+    _reference = synchronized_loop(_arrays, _choice)
+    assert (_table.dtypes == np.float64).all()
+    assert _table.equals(_reference.astype(np.float64))
+
+
+def test_random_sets() -> None:
+    '''Sets with random times, values and NaN give the table of the loop'''
+    _rng = np.random.default_rng(3)
+    for _ in range(50):
+        _sets = {}
+        for _key in ('a', 'b', 'c'):
+            _rows = _rng.integers(3, 80)
+            _times = 1_600_000_000_000_000_000 + 1_000_000 * np.cumsum(
+                _rng.integers(1, 4000, _rows))
+            _values = np.round(_rng.normal(0, 50, _rows), _rng.integers(0, 6))
+            _values[_rng.integers(0, _rows)] = np.nan
+            _sets[_key] = (_times, _values)
+        _choice = dict(default_choices, step=pd.Timedelta(int(_rng.integers(1, 5000)), 'ms'))
+        try:
+            _reference = synchronized_loop(_sets, _choice)
+        except IndexError:
+            continue        # the loop reads after the end of a set
+        assert synchronized_sets(_sets, _choice).equals(_reference.astype(np.float64))
+
+
+def test_round_values() -> None:
+    '''The values are rounded as Python's round, also near one half'''
+    _values = np.array([28.98065, 0.00005, 1.00005, -2.50015, 1/3, np.nan, 1e13 + 0.5])
+    _rounded = round_values(_values)
+    assert _rounded[:5].tolist() == [round(_v, 4) for _v in _values[:5].tolist()]
+    assert np.isnan(_rounded[5])
+    assert _rounded[6] == round(1e13 + 0.5, 4)
+
+
+def test_empty_interval() -> None:
+    '''An empty interval is interpolated, the last row of a set is not used'''
+    _times = np.array([0, 10, 40, 50], dtype=np.int64)
+    _values = np.array([0.0, 1.0, 4.0, 5.0])
+    _ticks = grid_ticks(0, 60, 10)
+    _aligned = align_set(_times, _values, _ticks, 10, 60)
+    # the tick 20 is between the rows 1 and 3: 1 + 10 * 4 / 40
+    assert _aligned[:5].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert np.isnan(_aligned[5])
+
+
+def test_custom_value() -> None:
+    '''Other functions of the values are called by the loop'''
+    _arrays = read_measures_arrays(os.path.join(DAT_DIR, 'data.csv'))
+    _choice = dict(default_choices, step='lcm')
+    _table = synchronized_sets(_arrays, _choice, choose_value=max)
+    assert (_table >= synchronized_sets(_arrays, _choice)).all().all()
+    assert synchronized_sets(_arrays, _choice, choose_value=mean_value).equals(
+        synchronized_sets(_arrays, _choice))
+
+
+@pytest.mark.parametrize("STEP", ["3s", "700ms"])
+def test_long_set(STEP) -> None:
+    '''A long set gives the table of the loop (timed in dat/benchmark_align.py)'''
+    _rows = 20_000
+    _rng = np.random.default_rng(0)
+    _times = 1_600_000_000_000_000_000 + 1_000_000_000 * np.arange(_rows, dtype=np.int64)
+    _sets = {'a': (_times, np.round(_rng.normal(0, 1, _rows), 3))}
+    _choice = dict(default_choices, step=STEP)
+    _table = synchronized_sets(_sets, _choice)
+    assert _table.equals(synchronized_loop(_sets, _choice).astype(np.float64))
+
+
+_LOOP_VALUES = {
+    'mean': mean_value,
+    'min': lambda x: round(min(x), 4),
+    'max': lambda x: round(max(x), 4),
+    'first': lambda x: round(x[0], 4),
+    'last': lambda x: round(x[-1], 4),
+    'median': lambda x: round(statistics.median(x), 4),
+    'sum': lambda x: round(math.fsum(x), 4),
+    'count': len,
+    'std': lambda x: round(statistics.pstdev(x), 4),
+    'range': lambda x: round(max(x) - min(x), 4),
+}
+
+
+@pytest.mark.parametrize("REDUCER", list(_LOOP_VALUES))
+@pytest.mark.parametrize("STEP", ["gcd", "lcm", "700ms", "13s"])
+def test_reducers(FILENAME, REDUCER, STEP) -> None:
+    '''Each reducer gives the table of the loop with the same function'''
+    _arrays = read_measures_arrays(FILENAME)
+    _choice = dict(default_choices, step=STEP, reducer=REDUCER)
+    _reference = synchronized_loop(_arrays, _choice, choose_value=_LOOP_VALUES[REDUCER])
+    assert synchronized_sets(_arrays, _choice).equals(_reference.astype(np.float64))
+
+
+def test_reducers_nan() -> None:
+    '''A NaN gives a NaN in its interval, it is not counted'''
+    _values = np.array([1.0, np.nan, 3.0, 2.0, 6.0, 4.0, 0.0])
+    _first, _last = np.array([0, 3]), np.array([3, 6])
+    for _name in ('mean', 'min', 'max', 'median', 'sum', 'std', 'range'):
+        _reduced = reducers[_name](_values, _first, _last)
+        assert np.isnan(_reduced[0]) and not np.isnan(_reduced[1])
+    assert reducers['median'](_values, _first, _last)[1] == 4.0
+    assert reducers['count'](_values, _first, _last).tolist() == [2.0, 3.0]
+    assert reducers['first'](_values, _first, _last).tolist() == [1.0, 2.0]
+
+
+def test_register_reducer() -> None:
+    '''A vectorized reducer is registered and chosen by its name'''
+    _arrays = read_measures_arrays(os.path.join(DAT_DIR, 'data.csv'))
+    _choice = dict(default_choices, step='lcm', reducer='half_range')
+    with pytest.raises(ValueError):
+        synchronized_sets(_arrays, _choice)
+    register_reducer('half_range',
+                     lambda _values, _first, _last: reducers['range'](_values, _first, _last) / 2)
+    try:
+        _table = synchronized_sets(_arrays, _choice)
+        _range = synchronized_sets(_arrays, dict(_choice, reducer='range'))
+        assert np.allclose(_table, _range / 2, atol=1e-4)
+    finally:
+        del reducers['half_range']
+
+
+def test_solve_tridiagonal() -> None:
+    '''The cyclic reduction gives the solution of the dense system'''
+    _rng = np.random.default_rng(5)
+    for _n in (1, 2, 3, 8, 1000):
+        _lower, _upper, _rhs = _rng.random(_n), _rng.random(_n), _rng.random(_n)
+        _diagonal = _lower + _upper + 1 + _rng.random(_n)
+        _matrix = (np.diag(_diagonal) + np.diag(_lower[1:], -1)
+                   + np.diag(_upper[:-1], 1))
+        assert np.allclose(solve_tridiagonal(_lower, _diagonal, _upper, _rhs),
+                           np.linalg.solve(_matrix, _rhs))
+
+
+def test_interpolations() -> None:
+    '''Each interpolation gives the expected values between the rows'''
+    _times = np.array([0, 10, 20, 40, 50], dtype=np.int64) * 1_000_000_000
+    _ticks = np.array([14, 16, 30], dtype=np.int64) * 1_000_000_000
+    _rows = np.searchsorted(_times, _ticks)
+    _values = np.array([0.0, 1.0, 2.0, 4.0, 5.0])
+    assert interpolations['zero'](_times, _values, _ticks, _rows).tolist() == [1.0, 1.0, 2.0]
+    assert interpolations['nearest'](_times, _values, _ticks, _rows).tolist() == [1.0, 2.0, 2.0]
+    # the splines reproduce a straight line and pass through the rows
+    for _name in ('pchip', 'cubic'):
+        _interpolate = interpolations[_name]
+        assert np.allclose(_interpolate(_times, _values, _ticks, _rows), [1.4, 1.6, 3.0])
+        _curve = np.sin(_times / 2e10)
+        assert np.allclose(_interpolate(_times, _curve, _times, np.arange(5)), _curve)
+
+
+def test_pchip_monotone() -> None:
+    '''The PCHIP interpolation of increasing values is increasing'''
+    _rng = np.random.default_rng(2)
+    _times = np.cumsum(_rng.integers(1, 100, 300)) * 1_000_000
+    _values = np.cumsum(_rng.random(300) ** 4)
+    _ticks = np.linspace(_times[0], _times[-1], 10_000).astype(np.int64)
+    _interpolated = interpolations['pchip'](_times, _values, _ticks,
+                                            np.searchsorted(_times, _ticks))
+    assert (np.diff(_interpolated) >= 0).all()
+    assert _interpolated.min() >= _values[0] and _interpolated.max() <= _values[-1]
+
+
+@pytest.mark.parametrize("INTERPOLATION", ["linear", "zero", "nearest", "pchip", "cubic"])
+def test_interpolation_modes(FILENAME, INTERPOLATION) -> None:
+    '''The interpolation only changes the empty intervals'''
+    _arrays = read_measures_arrays(FILENAME)
+    _choice = dict(default_choices, step='700ms')
+    _linear = synchronized_sets(_arrays, _choice)
+    _table = synchronized_sets(_arrays, dict(_choice, interpolation=INTERPOLATION))
+    assert _table.isna().equals(_linear.isna())
+    for _key, (_times, _) in _arrays.items():
+        _ticks = _table.index.values.view(np.int64)
+        _rows = np.searchsorted(_times, _ticks)
+        _filled = _rows < np.searchsorted(_times, _ticks + pd.Timedelta('700ms').value)
+        assert _table[_key][_filled].equals(_linear[_key][_filled])
+
+
+def test_interpolation_scale() -> None:
+    '''A million missing grid points are interpolated in one call per set'''
+    _rows = 1_000_000
+    _rng = np.random.default_rng(4)
+    _times = 1_000_000_000 * np.arange(_rows, dtype=np.int64)
+    _values = np.cumsum(_rng.normal(size=_rows))
+    _ticks = _times[1:-1] + 500_000_000
+    for _name in ('pchip', 'cubic'):
+        _interpolated = interpolations[_name](_times, _values, _ticks,
+                                              np.arange(2, _rows))
+        assert len(_interpolated) == _rows - 2 and np.isfinite(_interpolated).all()
+    with pytest.raises(ValueError):
+        synchronized_sets({'a': (_times[:10], _values[:10])},
+                          dict(default_choices, step='1s', interpolation='quadratic'))
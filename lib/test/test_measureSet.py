@@ -0,0 +1,194 @@
+import pytest
+
+'''
+Checks of the structures holding the sets, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+import numpy as np
+
+from lib.setsManagement import read_measures, synchronized_sets, as_measures
+from lib.setsManagement import check_constant_time_step, report_on_sets
+from lib.setsManagement import default_choices, unpack_table
+from lib.setsManagement import sets_starts_ends_steps, choose_start_end_step
+from lib.setsReader import read_measures_arrays
+from lib.measureSet import RegularSeries, regularize, MeasureSet, measure_sets
+from lib.measureSet import pack_values, unpack_values, MeasureSets
+
+
+@pytest.fixture(params=["data.csv", "data_ms.csv"])
+def FILENAME(request):
+    return os.path.abspath(os.path.join(DAT_DIR, request.param))
+
+
+def test_regularize(FILENAME) -> None:
+    '''The sets of the data files are regular and give the same table'''
+    _arrays = read_measures_arrays(FILENAME)
+    _regular = regularize(_arrays)
+    for _key, (_times, _values) in _arrays.items():
+        assert isinstance(_regular[_key], RegularSeries)
+        assert np.array_equal(_regular[_key].times, _times)
+    assert synchronized_sets(_regular).equals(
+        synchronized_sets(read_measures(FILENAME)))
+
+
+
+class _NoTimes(RegularSeries):
+    '''Regular series whose times shall not be computed'''
+    __slots__ = ()
+
+    @property
+    def times(self):
+        raise AssertionError('times of a regular series computed')
+
+
+@pytest.mark.parametrize("STEP", ["gcd", "lcm", "700ms", "13s"])
+def test_regular_alignment(FILENAME, STEP) -> None:
+    '''The rows of a regular series are located without computing its times'''
+    _arrays = read_measures_arrays(FILENAME)
+    _sets = regularize(measure_sets(_arrays))
+    _choice = dict(default_choices, step=STEP)
+    _table = synchronized_sets(_sets, _choice)
+    assert _table.equals(synchronized_sets(_arrays, _choice))
+    if STEP in ('gcd', '700ms'):
+        return      # the empty intervals are interpolated on the times
+    _sets = {_key: _NoTimes(_entry.start, _entry.step, _entry.values)
+             for _key, _entry in _sets.items()}
+    assert synchronized_sets(_sets, _choice).equals(_table)
+
+
+@pytest.mark.parametrize("PRECISION", ["float64", "float32", "scaled"])
+def test_regularize_precision(FILENAME, PRECISION) -> None:
+    '''The regular sets drop their times and keep the precision of their values'''
+    _arrays = read_measures_arrays(FILENAME)
+    _sets = measure_sets(_arrays, PRECISION)
+    _series = regularize(_sets)
+    for _key, (_times, _values) in _arrays.items():
+        assert isinstance(_series[_key], RegularSeries)
+        assert _series[_key].packed is _sets[_key].packed
+        assert _series[_key].nbytes == _sets[_key].packed.nbytes < _sets[_key].nbytes
+        assert np.array_equal(_series[_key].values, _values)
+        assert np.array_equal(_series[_key].times, _times)
+    _table = synchronized_sets(_series, dict(default_choices, precision=PRECISION))
+    assert _table.equals(synchronized_sets(_arrays, dict(default_choices, precision=PRECISION)))
+    _back = measure_sets(_series, None)
+    assert all(_back[_key].packed is _series[_key].packed for _key in _arrays)
+
+def test_regular_series_indexing() -> None:
+    '''Positions are computed arithmetically from start and step'''
+    _series = RegularSeries(start=100, step=10, values=np.arange(5.0))
+    assert _series.end == 140
+    assert _series.index_of([95, 100, 109, 110, 200]).tolist() == [-1, 0, 0, 1, 4]
+    _values = _series.at([100, 105, 140])
+    assert _values[0] == 0.0 and np.isnan(_values[1]) and _values[2] == 4.0
+
+
+def test_irregular_arrays() -> None:
+    '''Sets with a step changing are not converted'''
+    _times = np.array([0, 10, 20, 35])
+    assert RegularSeries.from_arrays(_times, np.zeros(4)) is None
+
+
+def test_measure_set(FILENAME) -> None:
+    '''The measure sets keep the arrays and replace the old dictionary'''
+    _reference = read_measures(FILENAME)
+    _sets = measure_sets(_reference)
+    for _key, _set in _sets.items():
+        assert isinstance(_set, MeasureSet) and _set.name == _key
+        assert len(_set) == len(_reference[_key])
+        assert _set.step is not None
+        assert np.asarray(_set) is _set.values
+        assert _set[1:][0] == _set[1]
+        assert _set[::2].step == 2 * _set.step
+    assert check_constant_time_step(_sets)
+    assert report_on_sets(_sets) == report_on_sets(_reference)
+    assert synchronized_sets(_sets).equals(synchronized_sets(_reference))
+    assert as_measures(_sets) == _reference
+
+
+def test_measure_set_formats(FILENAME) -> None:
+    '''The sets keep the datetime format detected by the reader'''
+    _arrays = read_measures_arrays(FILENAME)
+    _format = '%Y-%m-%d %H:%M:%S.%f' if 'ms' in FILENAME else '%Y-%m-%d %H:%M:%S'
+    assert set(_arrays.formats.values()) == {_format}
+    for _sets in (measure_sets(_arrays), measure_sets(_arrays, 'float32'),
+                  measure_sets(regularize(measure_sets(_arrays))),
+                  measure_sets(read_measures(FILENAME), formats=_arrays.formats)):
+        assert _sets.formats == _arrays.formats
+        assert all(_set.datetime_format == _format for _set in _sets.values())
+    assert all(_set.datetime_format is None
+               for _set in measure_sets(read_measures(FILENAME)).values())
+
+
+def test_measure_set_irregular() -> None:
+    '''A set with a step changing has no step'''
+    _set = MeasureSet.from_arrays('x', np.array([0, 10, 20, 35]), np.zeros(4))
+    assert _set.step is None
+    assert not check_constant_time_step({'x': _set})
+    with pytest.raises(ValueError):
+        MeasureSet('x', np.arange(3), np.zeros(2))
+
+
+@pytest.mark.parametrize("PRECISION", ["float32", "scaled"])
+def test_precision(FILENAME, PRECISION) -> None:
+    '''The values stored with a smaller precision are given back exactly'''
+    _arrays = read_measures_arrays(FILENAME)
+    _sets = measure_sets(_arrays, PRECISION)
+    for _key, (_times, _values) in _arrays.items():
+        assert _sets[_key].packed.itemsize == 4
+        assert np.array_equal(_sets[_key].values, _values)
+    _reference = synchronized_sets(_arrays)
+    _table = synchronized_sets(_sets, dict(default_choices, precision=PRECISION))
+    assert (_table.dtypes.map(lambda _dtype: _dtype.itemsize) == 4).all()
+    assert unpack_table(_table).to_csv() == _reference.to_csv()
+
+
+def test_precision_repacked(FILENAME) -> None:
+    '''The measure sets are packed again with another precision, or kept'''
+    _arrays = read_measures_arrays(FILENAME)
+    _sets = measure_sets(_arrays, 'float32')
+    for _precision, _dtype in (('scaled', np.int32), ('float64', np.float64),
+                               ('float32', np.float32)):
+        _repacked = measure_sets(_sets, _precision)
+        for _key, (_times, _values) in _arrays.items():
+            assert _repacked[_key].packed.dtype == _dtype
+            assert np.array_equal(_repacked[_key].values, _values)
+            assert (_repacked[_key] is _sets[_key]) == (_precision == 'float32')
+    assert all(_entry is _sets[_key]
+               for _key, _entry in measure_sets(_sets, None).items())
+
+
+def test_precision_fallback() -> None:
+    '''Values needing more decimals are kept in float64'''
+    _packed, _decimals = pack_values(np.array([1/3, 2.5]), 'scaled')
+    assert _packed.dtype == np.float64 and _decimals is None
+    _packed, _decimals = pack_values(np.array([1.25, np.nan, -2.5]), 'scaled')
+    assert _packed.dtype == np.int32 and _decimals == 2
+    assert np.array_equal(unpack_values(_packed, _decimals),
+                          [1.25, np.nan, -2.5], equal_nan=True)
+
+
+def test_characteristics_cache(FILENAME) -> None:
+    '''The characteristics are computed once, until a set changes'''
+    _sets = measure_sets(read_measures_arrays(FILENAME))
+    assert isinstance(_sets, MeasureSets) and _sets.characteristics is None
+    _char = sets_starts_ends_steps(_sets)
+    assert _sets.characteristics is _char
+    assert sets_starts_ends_steps(_sets) is _char
+    choose_start_end_step(_sets, dict(default_choices, step='lcm'))
+    assert _sets.characteristics is _char
+    _name = list(_sets)[0]
+    _sets[_name] = _sets[_name][:-10]       # a set replaced by a shorter one
+    assert _sets.characteristics is None
+    assert sets_starts_ends_steps(_sets)['ends'][0] < _char['ends'][0]
+    del _sets[_name]
+    assert _sets.characteristics is None
@@ -18,6 +18,10 @@ sys.path.append(LIB_DIR)
 from lib.setsManagement import read_measures, check_constant_time_step
 from lib.setsManagement import check_datetime_format, sets_starts_ends_steps
 from lib.setsManagement import sets_starts_ends_steps, report_on_sets
+from lib.setsManagement import synchronized_sets
+
+import numpy as np
+import pandas as pd
 
 # we read files to be tested and converts to sets dictionaries
 @pytest.fixture
@@ -56,6 +60,20 @@ def test_check_datetime_format(DATE, FORMAT):
     assert check_datetime_format(DATE) == FORMAT
 
 
+def test_microsecond_steps() -> None:
+    '''Steps below the millisecond give an exact lcm, gcd and grid'''
+    _start = 1_700_000_000 * 10**9
+    _sets = {'a': (_start + np.arange(400) * 250_000, np.arange(400.0)),
+             'b': (_start + np.arange(250) * 400_000, np.arange(250.0))}
+    _char = sets_starts_ends_steps(_sets)
+    assert _char['time_step_gcd'] == pd.Timedelta(microseconds=50)
+    assert _char['time_step_lcm'] == pd.Timedelta(milliseconds=2)
+    _table = synchronized_sets(_sets)
+    assert len(_table) == (99_600_000 - 0) // 50_000
+    assert (np.diff(_table.index.asi8) == 50_000).all()
+    assert _table['a'].iloc[5] == 1.0 and _table['b'].iloc[8] == 1.0
+
+
 '''
 >> add some test for
 sets_starts_ends_steps
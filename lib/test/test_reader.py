@@ -0,0 +1,311 @@
+import pytest
+
+'''
+Checks of the vectorized reader of the sets, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+import numpy as np
+
+from lib.setsManagement import read_measures, synchronized_sets, report_on_sets
+from lib.setsManagement import synchronized_tail, default_choices, unpack_table
+from lib.setsReader import read_measures_arrays, measure_pairs, iter_measures
+from lib.setsReader import index_sets, LazySets, read_measures_parallel
+from lib.setsReader import reader_settings, decode_timestamps
+from lib.setsReader import detect_datetime_format, infer_datetime_format
+from lib.setsReader import read_measures_files, TailReader, file_layout
+import pandas as pd
+import bz2, gzip, lzma
+
+
+@pytest.fixture(params=["data.csv", "data_ms.csv"])
+def FILENAME(request):
+    return os.path.abspath(os.path.join(DAT_DIR, request.param))
+
+
+def test_arrays_match_read_measures(FILENAME) -> None:
+    '''The arrays give back the couples of read_measures'''
+    _reference = read_measures(FILENAME)
+    _arrays = read_measures_arrays(FILENAME, settings={'chunk_bytes': 512})
+    assert list(_arrays.keys()) == list(_reference.keys())
+    for _key, (_times, _values) in _arrays.items():
+        assert _times.dtype == np.int64
+        assert _values.dtype == np.float64
+        assert measure_pairs(_times, _values) == _reference[_key]
+
+
+def test_time_only_format(tmp_path) -> None:
+    '''Time without date is taken on the 1900-01-01 as with strptime'''
+    _file = tmp_path / 'time_only.csv'
+    _file.write_text('MEAS\n08:00:00.500,1.5\n08:00:01.000,2\n')
+    _times, _values = read_measures_arrays(str(_file))['MEAS']
+    assert _times[0] == np.datetime64('1900-01-01T08:00:00.500', 'ns').view(np.int64)
+    assert _values.tolist() == [1.5, 2.0]
+
+
+
+def test_nanoseconds_read_measures(tmp_path) -> None:
+    '''The date-times with 9 digits are read as the arrays, to the microsecond'''
+    _file = tmp_path / 'nanoseconds.csv'
+    _file.write_text('MEAS\n2023-10-07 08:00:00.123456789,1.5\n'
+                     '2023-10-07 08:00:01.000000001,2\n')
+    _errors = []
+    _measures = read_measures(str(_file), _errors)
+    _times, _values = read_measures_arrays(str(_file))['MEAS']
+    assert not _errors and _measures['MEAS'] == measure_pairs(_times, _values)
+    assert _measures['MEAS'][0][0].microsecond == 123456
+
+
+def test_format_per_set(tmp_path) -> None:
+    '''The date-time format of each set is detected on its own rows'''
+    _file = tmp_path / 'mixed.csv'
+    _file.write_text('A\n2023-10-07 08:00:00.250,1\n2023-10-07 08:00:01.250,2\n'
+                     'B\n2023-10-07 08:00:00,3\n2023-10-07 08:00:05,4\n'
+                     'C\n2023-10-07 08:00:00.5,5\n2023-10-07 08:00:01.5,6\n')
+    _errors = []
+    _measures = read_measures(str(_file), _errors)
+    assert not _errors and [len(_set) for _set in _measures.values()] == [2, 2, 2]
+    _arrays = read_measures_arrays(str(_file))
+    for _key, (_times, _values) in _arrays.items():
+        assert _measures[_key] == measure_pairs(_times, _values)
+
+def test_stream_chunks_are_bounded(FILENAME) -> None:
+    '''The stream yields small chunks of a same set and synchronizes'''
+    with open(FILENAME, 'rb') as _file:
+        _chunks = list(iter_measures(_file, settings={'chunk_bytes': 1024}))
+    assert max(len(_times) for _name, _times, _values in _chunks) < 1024 // 19
+    with open(FILENAME, 'rb') as _file:
+        _stream = iter_measures(_file, settings={'chunk_bytes': 1024})
+        _table = synchronized_sets(_stream)
+    assert _table.equals(synchronized_sets(read_measures(FILENAME)))
+
+
+def test_index_sets(FILENAME) -> None:
+    '''The index gives the rows and bounds of each set'''
+    _arrays = read_measures_arrays(FILENAME)
+    _index = index_sets(FILENAME, settings={'chunk_bytes': 333})
+    assert [_entry.name for _entry in _index] == list(_arrays.keys())
+    for _entry in _index:
+        _times = _arrays[_entry.name][0]
+        assert _entry.rows == len(_times)
+        assert (_entry.first, _entry.second, _entry.last) == \
+            (_times[0], _times[1], _times[-1])
+
+
+def test_lazy_sets(FILENAME) -> None:
+    '''The report is done from the index, the sets are parsed on demand'''
+    _lazy = LazySets(FILENAME)
+    assert report_on_sets(_lazy) == report_on_sets(read_measures(FILENAME))
+    assert not _lazy._loaded
+    for _key, (_times, _values) in read_measures_arrays(FILENAME).items():
+        assert np.array_equal(_lazy[_key][0], _times)
+        assert np.array_equal(_lazy[_key][1], _values)
+
+
+def test_read_measures_parallel(FILENAME) -> None:
+    '''Blocks parsed by several processes are merged in the file order'''
+    _settings = dict(reader_settings, workers=2, split_bytes=1000)
+    _parallel = read_measures_parallel(FILENAME, settings=_settings)
+    _arrays = read_measures_arrays(FILENAME)
+    assert list(_parallel.keys()) == list(_arrays.keys())
+    for _key, (_times, _values) in _arrays.items():
+        assert np.array_equal(_parallel[_key][0], _times)
+        assert np.array_equal(_parallel[_key][1], _values)
+
+
+# fixed-width date-times with their expected validity
+@pytest.mark.parametrize("RAW, FORMAT, VALID", [
+    (b"2023-10-22 08:10:30", "%Y-%m-%d %H:%M:%S", True),
+    (b"2023-10-22 08:10:30.432", "%Y-%m-%d %H:%M:%S.%f", True),
+    (b"08:10:30.432", "%H:%M:%S.%f", True),
+    (b"2023-02-30 08:10:30", "%Y-%m-%d %H:%M:%S", False),
+    (b"2023-10-22 24:10:30", "%Y-%m-%d %H:%M:%S", False),
+    (b"2023-10-22 08:61:30", "%Y-%m-%d %H:%M:%S", False),
+    (b"2023-10-22T08:10:30", "%Y-%m-%d %H:%M:%S", False),
+    (b"08:1a:30", "%H:%M:%S", False),
+])
+def test_decode_timestamps(RAW, FORMAT, VALID):
+    _times, _invalid = decode_timestamps(np.array([RAW]), FORMAT)
+    assert _invalid[0] != VALID
+    if VALID:
+        _text = RAW.decode() if FORMAT.startswith('%Y') else '1900-01-01 ' + RAW.decode()
+        assert _times[0] == np.datetime64(_text, 'ns').view(np.int64)
+
+
+def test_malformed_row_in_chunk() -> None:
+    '''Each row is checked against its own length, not the longest one'''
+    _raw = np.array([b"2023-01-01 00:00:00", b"2023-01-01 00:00:01",
+                     b"2023-01-01 00:00:02xx", b"2023-01-01 00:00:03",
+                     b"2023-01-01 00:00:04"])
+    _times, _invalid = decode_timestamps(_raw, "%Y-%m-%d %H:%M:%S")
+    assert _invalid.tolist() == [False, False, True, False, False]
+    assert _times[4] == np.datetime64("2023-01-01T00:00:04", 'ns').view(np.int64)
+
+
+def test_mixed_fraction_widths() -> None:
+    '''The fraction of each row is read with its own number of digits'''
+    _raw = np.array([b"2023-01-01 00:00:00.5", b"2023-01-01 00:00:00.25",
+                     b"2023-01-01 00:00:00.125", b"2023-01-01 00:00:00.123456789",
+                     b"2023-01-01 00:00:00.", b"2023-01-01 00:00:00.1x"])
+    _times, _invalid = decode_timestamps(_raw, "%Y-%m-%d %H:%M:%S.%f")
+    assert _invalid.tolist() == [False] * 4 + [True, True]
+    _base = np.datetime64("2023-01-01", 'ns').view(np.int64)
+    assert (_times[:4] - _base).tolist() == [500_000_000, 250_000_000,
+                                             125_000_000, 123_456_789]
+
+
+# date-times of other sources, with their format and time in UTC
+@pytest.mark.parametrize("RAW, FORMAT, UTC", [
+    (b"2023-10-22T08:10:30", "%Y-%m-%dT%H:%M:%S", "2023-10-22T08:10:30"),
+    (b"2023-10-22T08:10:30.123456", "%Y-%m-%dT%H:%M:%S.%f",
+     "2023-10-22T08:10:30.123456"),
+    (b"2023-10-22T10:10:30+02:00", "%Y-%m-%dT%H:%M:%S%z", "2023-10-22T08:10:30"),
+    (b"2023-10-22 04:40:30.5-0330", "%Y-%m-%d %H:%M:%S.%f%z",
+     "2023-10-22T08:10:30.5"),
+    (b"2023-10-22T08:10:30Z", "%Y-%m-%dT%H:%M:%S%z", "2023-10-22T08:10:30"),
+    (b"1697962230", "epoch_s", "2023-10-22T08:10:30"),
+    (b"1697962230.25", "epoch_s", "2023-10-22T08:10:30.25"),
+    (b"1697962230432", "epoch_ms", "2023-10-22T08:10:30.432"),
+    (b"1697962230432101", "epoch_us", "2023-10-22T08:10:30.432101"),
+])
+def test_other_formats(RAW, FORMAT, UTC):
+    assert detect_datetime_format(RAW.decode()) == FORMAT
+    _times, _invalid = decode_timestamps(np.array([RAW]), FORMAT)
+    assert not _invalid[0]
+    assert _times[0] == np.datetime64(UTC, 'ns').view(np.int64)
+
+
+def test_infer_datetime_format() -> None:
+    '''The format is the one of most of the rows sampled'''
+    _rows = np.array([b'2023-10-22T08:10:30Z,1.0'] * 20 + [b'bad,2.0'])
+    assert infer_datetime_format(_rows) == '%Y-%m-%dT%H:%M:%S%z'
+    assert infer_datetime_format(np.array([b'bad'])) is None
+
+
+def test_offset_file(FILENAME, tmp_path) -> None:
+    '''Sets written in ISO 8601 with an offset are read back in UTC'''
+    _arrays = read_measures_arrays(FILENAME)
+    _iso = str(tmp_path / 'iso.csv')
+    with open(_iso, 'w') as _file:
+        for _key, (_times, _values) in _arrays.items():
+            _local = (_times + 7_200_000_000_000).view('datetime64[ns]')
+            _local = _local.astype('datetime64[ms]')
+            _file.write(_key + '\n')
+            _file.writelines(f'{_t}+02:00,{_v}\n'
+                             for _t, _v in zip(_local.astype(str), _values.tolist()))
+    for _result in (read_measures_arrays(_iso), LazySets(_iso)):
+        for _key, (_times, _values) in _arrays.items():
+            assert np.array_equal(_result[_key][0], _times)
+    assert synchronized_sets(read_measures(_iso)).equals(
+        synchronized_sets(read_measures(FILENAME)))
+
+
+def test_read_measures_files(tmp_path) -> None:
+    '''Files of several days are merged set by set in time order'''
+    _lines = open(os.path.join(DAT_DIR, 'data.csv')).read().splitlines()
+    _title = _lines[0]
+    _rows = [_line for _line in _lines[1:] if ',' in _line][:100]
+    for _day, _part in (('2', _rows[50:]), ('1', _rows[:50])):
+        (tmp_path / f'day{_day}.csv').write_text('\n'.join([_title, *_part]))
+    _merged = read_measures_files(str(tmp_path / 'day*.csv'))
+    _times, _values = read_measures_arrays(os.path.join(DAT_DIR, 'data.csv'))[_title]
+    assert np.array_equal(_merged[_title][0], _times[:100])
+    assert np.array_equal(_merged[_title][1], _values[:100])
+
+
+@pytest.mark.parametrize("OPENER, SUFFIX", [
+    (gzip.open, '.gz'), (bz2.open, '.bz2'), (lzma.open, '.xz')])
+def test_compressed_input(FILENAME, tmp_path, OPENER, SUFFIX) -> None:
+    '''Compressed files are detected by their content and streamed'''
+    _compressed = str(tmp_path / ('data' + SUFFIX))
+    with open(FILENAME, 'rb') as _source, OPENER(_compressed, 'wb') as _target:
+        _target.write(_source.read())
+    _settings = dict(reader_settings, chunk_bytes=4096, prefetch_blocks=2)
+    _arrays = read_measures_arrays(_compressed, settings=_settings)
+    for _key, (_times, _values) in read_measures_arrays(FILENAME).items():
+        assert np.array_equal(_arrays[_key][0], _times)
+        assert np.array_equal(_arrays[_key][1], _values)
+    assert read_measures(_compressed) == read_measures(FILENAME)
+
+
+@pytest.mark.parametrize("CUT", [0.3, 0.9])
+def test_tail_reader(FILENAME, tmp_path, CUT) -> None:
+    '''Rows appended to a file extend the sets and the table'''
+    _content = open(FILENAME, 'rb').read()
+    _cut = int(CUT * len(_content))     # inside a line
+    _followed = str(tmp_path / 'followed.csv')
+    with open(_followed, 'wb') as _file:
+        _file.write(_content[:_cut])
+    _tail = TailReader(_followed, settings=dict(reader_settings, chunk_bytes=512))
+    _tail.update()
+    _table = synchronized_sets(_tail.measures)
+    with open(_followed, 'ab') as _file:
+        _file.write(_content[_cut:])
+    _new = _tail.update()
+    assert sum(len(_times) for _times, _ in _new.values()) > 0
+    for _key, (_times, _values) in read_measures_arrays(FILENAME).items():
+        assert np.array_equal(_tail.measures[_key][0], _times)
+        assert np.array_equal(_tail.measures[_key][1], _values)
+    assert synchronized_tail(_table, _tail.measures).equals(
+        synchronized_sets(read_measures(FILENAME)))
+
+
+@pytest.mark.parametrize("PRECISION", ["float64", "float32", "scaled"])
+def test_tail_fills_empty_ticks(PRECISION) -> None:
+    '''The ticks left empty after the end of a set are filled by the tail'''
+    _base = np.datetime64('2023-01-01T00:00:00', 'ns').view(np.int64)
+    _rng = np.random.default_rng(0)
+    _sets = {_key: (_base + np.arange(_rows, dtype=np.int64) * _step * 10**9,
+                    np.round(_rng.normal(0, 10, _rows), 2))
+             for _key, _step, _rows in (('A', 2, 120), ('B', 3, 75), ('C', 5, 40))}
+    _choice = dict(default_choices, step='gcd', precision=PRECISION)
+    _head = {_key: (_times[:2 * len(_times) // 3], _values[:2 * len(_times) // 3])
+             for _key, (_times, _values) in _sets.items()}
+    _table = synchronized_sets(_head, _choice)
+    assert unpack_table(_table)['C'].isna().any()
+    _reference = synchronized_sets(_sets, _choice)
+    assert synchronized_tail(_table, _sets, _choice).equals(_reference)
+    assert synchronized_tail(_reference, _sets, _choice).equals(_reference)
+
+
+
+@pytest.mark.parametrize("INTERPOLATION", ["pchip", "cubic"])
+def test_tail_interpolation(FILENAME, INTERPOLATION) -> None:
+    '''The tail gives the interpolated values of the whole sets'''
+    _arrays = read_measures_arrays(FILENAME)
+    _choice = dict(default_choices, step='700ms', interpolation=INTERPOLATION)
+    _head = {_key: (_times[:len(_times) // 2], _values[:len(_times) // 2])
+             for _key, (_times, _values) in _arrays.items()}
+    _table = synchronized_tail(synchronized_sets(_head, _choice), _arrays, _choice)
+    assert _table.equals(synchronized_sets(_arrays, _choice))
+
+def write_wide(filename: str, arrays: dict, datetime_format: str) -> None:
+    '''Write the sets in a wide file, one column per set'''
+    _table = pd.concat({_key: pd.Series(_values, index=pd.to_datetime(_times))
+                        for _key, (_times, _values) in arrays.items()},
+                       axis=1, sort=True)
+    _table.to_csv(filename, date_format=datetime_format, index_label='datetime')
+
+
+def test_wide_file(FILENAME, tmp_path) -> None:
+    '''A file with a column per set gives the same sets and table'''
+    _arrays = read_measures_arrays(FILENAME)
+    _wide = str(tmp_path / 'wide.csv')
+    write_wide(_wide, _arrays, '%Y-%m-%d %H:%M:%S.%f')
+    assert file_layout(_wide) == 'wide' and file_layout(FILENAME) == 'stacked'
+    _settings = dict(reader_settings, chunk_bytes=1000)
+    _result = read_measures_arrays(_wide, settings=_settings)
+    assert list(_result.keys()) == list(_arrays.keys())
+    for _key, (_times, _values) in _arrays.items():
+        assert np.array_equal(_result[_key][0], _times)
+        assert np.array_equal(_result[_key][1], _values)
+    assert synchronized_sets(_result).equals(synchronized_sets(read_measures(FILENAME)))
@@ -0,0 +1,54 @@
+import pytest
+
+'''
+Checks of the sets placed in shared memory, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+from lib.setsReader import read_measures_arrays
+from lib.measureSet import measure_sets
+from lib.setsShared import SharedSets
+
+
+@pytest.fixture(params=["data.csv", "data_ms.csv"])
+def FILENAME(request):
+    return os.path.abspath(os.path.join(DAT_DIR, request.param))
+
+
+def set_sum(shared: SharedSets, name: str) -> float:
+    '''Function run by the worker processes'''
+    return float(np.nansum(shared[name].values))
+
+
+@pytest.mark.parametrize("PRECISION", ["float64", "scaled"])
+def test_shared_sets(FILENAME, PRECISION) -> None:
+    '''The workers read the same sets as the owner, from the table only'''
+    _sets = measure_sets(read_measures_arrays(FILENAME), PRECISION)
+    with SharedSets.create(_sets) as _shared:
+        assert len(pickle.dumps(_shared)) < 2048
+        for _key, _set in _sets.items():
+            assert np.array_equal(_shared[_key].times, _set.times)
+            assert np.array_equal(_shared[_key].values, _set.values, equal_nan=True)
+            assert _shared[_key].step == _set.step
+            assert _shared[_key].packed.dtype == _set.packed.dtype
+            assert _shared[_key].datetime_format == _set.datetime_format is not None
+        with ProcessPoolExecutor(max_workers=2) as _executor:
+            _sums = list(_executor.map(set_sum, [_shared] * len(_shared), _shared))
+        assert _sums == [float(np.nansum(_set.values)) for _set in _sets.values()]
+        _segment = _shared.segment
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=_segment)
@@ -0,0 +1,84 @@
+import pytest
+
+'''
+Checks of the statistics on the sets, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+import numpy as np
+
+from lib.setsReader import read_measures_arrays, iter_measures, open_measures
+from lib.setsReader import reader_settings
+from lib.setsStore import write_chunked
+from lib.setsStatistics import sets_statistics, set_statistics, statistics_report
+from lib.setsStatistics import StatisticsAccumulator, statistics_settings
+from lib.setsStatistics import parallel_statistics
+from lib.setsShared import SharedSets
+from lib.measureSet import measure_sets
+
+
+@pytest.fixture(params=["data.csv", "data_ms.csv"])
+def FILENAME(request):
+    return os.path.abspath(os.path.join(DAT_DIR, request.param))
+
+
+def test_statistics(FILENAME) -> None:
+    '''The statistics are the ones of numpy on each set'''
+    _arrays = read_measures_arrays(FILENAME)
+    _statistics = sets_statistics(_arrays)
+    for _key, (_, _values) in _arrays.items():
+        assert _statistics[_key].rows == len(_values) and _statistics[_key].nans == 0
+        assert _statistics[_key].mean == pytest.approx(_values.mean())
+        assert _statistics[_key].std == pytest.approx(_values.std())
+        assert _statistics[_key].quantiles[0.5] == np.median(_values)
+    assert 'q95' in statistics_report(_statistics)
+
+
+def test_streamed_statistics(FILENAME, tmp_path) -> None:
+    '''The statistics streamed by chunks are the same'''
+    _reference = sets_statistics(read_measures_arrays(FILENAME))
+    _settings = dict(reader_settings, chunk_bytes=2000)
+    with open_measures(FILENAME, _settings) as _file:
+        _streamed = sets_statistics(iter_measures(_file, _settings))
+    _store = write_chunked(FILENAME, str(tmp_path / 'chunks'), {'chunk_seconds': 60})
+    _stored = sets_statistics(_store, dict(statistics_settings, stream_rows=500))
+    for _key, _statistics in _reference.items():
+        for _result in (_streamed[_key], _stored[_key]):
+            assert (_result.rows, _result.min, _result.max) == (
+                _statistics.rows, _statistics.min, _statistics.max)
+            assert _result.mean == pytest.approx(_statistics.mean)
+            assert _result.std == pytest.approx(_statistics.std)
+            assert _result.quantiles == pytest.approx(_statistics.quantiles)
+
+
+def test_sketch_quantiles() -> None:
+    '''Above the size of the sketch, the quantiles are close estimates'''
+    _values = np.random.default_rng(0).normal(size=200_000)
+    _values[::100] = np.nan
+    _accumulator = StatisticsAccumulator('x')
+    for _chunk in np.array_split(_values, 50):
+        _accumulator.add(_chunk)
+    _result, _reference = _accumulator.result(), set_statistics('x', _values)
+    assert _result.nans == _reference.nans == 2000
+    assert _result.std == pytest.approx(_reference.std)
+    for _q, _value in _reference.quantiles.items():
+        assert abs(_result.quantiles[_q] - _value) < 0.01
+
+
+@pytest.mark.parametrize("PRECISION", ["float64", "scaled"])
+def test_parallel_statistics(FILENAME, PRECISION) -> None:
+    '''The workers give the statistics of the shared sets'''
+    _sets = measure_sets(read_measures_arrays(FILENAME), PRECISION)
+    with SharedSets.create(_sets) as _shared:
+        _statistics = parallel_statistics(_shared, dict(statistics_settings, workers=2))
+    assert list(_statistics) == list(_sets)
+    assert statistics_report(_statistics) == statistics_report(sets_statistics(_sets))
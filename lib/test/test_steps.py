@@ -0,0 +1,139 @@
+import pytest
+
+'''
+Checks of the time steps of the sets, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+import numpy as np
+
+from lib.setsManagement import check_constant_time_step, sets_starts_ends_steps
+from lib.setsManagement import synchronized_sets, synchronized_loop, default_choices
+from lib.setsReader import read_measures_arrays, LazySets
+from lib.setsStore import write_chunked
+from lib.measureSet import measure_sets
+from lib.setsSteps import step_report, steps_report, SegmentIndex
+
+
+@pytest.fixture(params=["data.csv", "data_ms.csv"])
+def FILENAME(request):
+    return os.path.abspath(os.path.join(DAT_DIR, request.param))
+
+
+def test_regular_sets(FILENAME) -> None:
+    '''The sets of the data files have a constant step'''
+    _arrays = read_measures_arrays(FILENAME)
+    for _key, _report in steps_report(_arrays).items():
+        assert _report.regular and _report.rows == len(_arrays[_key][0])
+        assert _report.step == np.diff(_arrays[_key][0])[0]
+    assert check_constant_time_step(_arrays)
+
+
+def test_irregular_set() -> None:
+    '''Each step differing from the nominal one is reported'''
+    _times = np.array([0, 1000, 2000, 3030, 4000, 5000, 9000, 10000, 10000,
+                       11000, 10500, 11500, 12500])
+    _report = step_report('x', _times)
+    assert _report.step == 1000 and not _report.regular
+    assert _report.max_jitter == 30
+    assert _report.gaps.tolist() == [5] and _report.gap_steps.tolist() == [4000]
+    assert _report.duplicates.tolist() == [7]
+    assert _report.out_of_order.tolist() == [9]
+    assert _report.deviations == 5
+    assert not check_constant_time_step({'x': (_times, np.zeros(len(_times)))})
+
+
+def test_step_report_large() -> None:
+    '''A gap is found among millions of steps (timed in dat/benchmark_read.py)'''
+    _times = np.arange(5_000_000, dtype=np.int64) * 1_000_000
+    _times[2_500_000:] += 5_000_000
+    _report = step_report('x', _times)
+    assert _report.gaps.tolist() == [2_499_999] and _report.deviations == 1
+
+
+def test_segment_index() -> None:
+    '''The regular runs of a set are found around its gaps'''
+    _times = np.array([0, 1000, 2000, 5000, 6000, 7000, 8000, 8500, 9000, 9500])
+    _index = SegmentIndex.from_times(_times)
+    assert _index.segments == [(0, 1000, 0, 3), (5000, 1000, 3, 4), (8500, 500, 7, 3)]
+    assert _index.step == 1000
+    _rows, _gap = _index.locate([-5, 0, 1500, 2000, 3000, 4999, 5000, 8250, 20000])
+    assert _rows.tolist() == [-1, 0, 1, 2, 2, 2, 3, 6, 9]
+    assert _gap.tolist() == [False, False, False, False, True, True, False, True, False]
+
+
+def test_gap_at_start(FILENAME) -> None:
+    '''A dropout after the first rows does not change the step of a set'''
+    _arrays = read_measures_arrays(FILENAME)
+    _reference = sets_starts_ends_steps(_arrays)['time_step']
+    _name = list(_arrays)[0]
+    _times, _values = _arrays[_name]
+    _keep = np.r_[0:1, 3:len(_times)]
+    _arrays[_name] = (_times[_keep], _values[_keep])
+    assert sets_starts_ends_steps(_arrays)['time_step'] == _reference
+    assert steps_report(_arrays)[_name].gaps_only
+
+
+def test_gap_at_start_lazy(FILENAME, tmp_path) -> None:
+    '''The sets parsed from an index or read from the disk take the step of their runs'''
+    with open(FILENAME) as _file:
+        _lines = _file.readlines()
+    _filename = str(tmp_path / 'dropout.csv')
+    with open(_filename, 'w') as _file:
+        _file.writelines(_lines[:2] + _lines[4:])
+    _arrays = read_measures_arrays(_filename)
+    _reference = sets_starts_ends_steps(_arrays)['time_step']
+    _store = write_chunked(_filename, str(tmp_path / 'chunks'), {'chunk_seconds': 60})
+    _lazy = LazySets(_filename)
+    # the sets not parsed take the step of the index, without being parsed
+    assert sets_starts_ends_steps(_lazy)['time_step'][0] == 3 * _reference[0]
+    assert not any(_lazy.is_loaded(_key) for _key in _lazy)
+    _lazy = LazySets(_filename)
+    for _key in _lazy:
+        _lazy[_key]
+    for _data in (_lazy, _store):
+        assert sets_starts_ends_steps(_data)['time_step'] == _reference
+    _table = synchronized_sets(_arrays, default_choices)
+    assert synchronized_sets(_lazy, default_choices).equals(_table)
+    assert synchronized_sets(_store, default_choices).equals(_table)
+
+
+def test_aligned_on_segments(FILENAME) -> None:
+    '''The rows of the sets with a constant step are located in their runs'''
+    _arrays = read_measures_arrays(FILENAME)
+    _sets = measure_sets(_arrays)
+    assert all(_set.step is not None for _set in _sets.values())
+    for _step in ('gcd', 'lcm', '700ms', '13s'):
+        _choice = dict(default_choices, step=_step)
+        assert synchronized_sets(_sets, _choice).equals(synchronized_sets(_arrays, _choice))
+
+
+def test_aligned_with_gaps() -> None:
+    '''The ticks in a gap are interpolated as by the loop, or left empty'''
+    _base = np.datetime64('2023-10-07T08:00:00', 'ns').view(np.int64)
+    _times = _base + 2_000_000_000 * np.arange(300, dtype=np.int64)
+    _times = _times[(_times < _base + 100 * 10**9) | (_times >= _base + 160 * 10**9)]
+    _rng = np.random.default_rng(6)
+    _sets = {'A': (_times, np.round(_rng.normal(0, 10, len(_times)), 2)),
+             'B': (_base + 1_000_000_000 * np.arange(600, dtype=np.int64),
+                   np.round(_rng.normal(0, 10, 600), 2))}
+    assert len(SegmentIndex.from_times(_times)) == 2
+    _choice = dict(default_choices, step='2s')
+    _table = synchronized_sets(_sets, _choice)
+    assert _table.equals(synchronized_loop(_sets, _choice).astype(np.float64))
+    _empty = synchronized_sets(_sets, dict(_choice, gaps='empty'))
+    _ticks = _table.index.values.view(np.int64)
+    _in_gap = (_ticks >= _base + 100 * 10**9) & (_ticks < _base + 160 * 10**9)
+    assert _empty['A'][_in_gap].isna().all() and _table['A'][_in_gap].notna().all()
+    assert _empty[~_in_gap].equals(_table[~_in_gap]) and _empty['B'].equals(_table['B'])
+    with pytest.raises(ValueError):
+        synchronized_sets(_sets, dict(_choice, gaps='fill'))
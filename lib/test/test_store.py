@@ -0,0 +1,129 @@
+import pytest
+
+'''
+Checks of the storage of the parsed sets, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+import shutil
+import numpy as np
+
+from lib.setsReader import read_measures_arrays
+from lib.setsStore import load_measures, read_cache, cache_path, write_chunked
+from lib.setsManagement import synchronized_sets, read_measures
+from lib.setsManagement import default_choices, mean_value
+
+
+@pytest.fixture
+def INPUT(tmp_path):
+    '''A copy of the data file which can be modified'''
+    _filename = str(tmp_path / 'data_ms.csv')
+    shutil.copy(os.path.join(DAT_DIR, 'data_ms.csv'), _filename)
+    return _filename
+
+
+@pytest.fixture(params=['directory', 'sidecar'])
+def SETTINGS(request, tmp_path):
+    _directory = str(tmp_path / 'cache') if request.param == 'directory' else None
+    return {'directory': _directory, 'max_bytes': 1 << 30, 'hash_bytes': 4096}
+
+
+def test_cache_round_trip(INPUT, SETTINGS) -> None:
+    '''The sets written in the cache are read back memory-mapped'''
+    assert read_cache(INPUT, SETTINGS) is None
+    _parsed = load_measures(INPUT, SETTINGS)
+    _cached = read_cache(INPUT, SETTINGS)
+    assert list(_cached.keys()) == list(_parsed.keys())
+    assert _cached.formats == _parsed.formats
+    for _key, (_times, _values) in _parsed.items():
+        assert isinstance(_cached[_key][0], np.memmap)
+        assert np.array_equal(_cached[_key][0], _times)
+        assert np.array_equal(_cached[_key][1], _values)
+
+
+def test_cache_invalidated(INPUT, SETTINGS) -> None:
+    '''A modified input does not use the cache of its previous content'''
+    load_measures(INPUT, SETTINGS)
+    with open(INPUT, 'a') as _file:
+        _file.write('2023-10-07 10:10:02.250,1.0\n')
+    assert read_cache(INPUT, SETTINGS) is None
+    _times = load_measures(INPUT, SETTINGS)['LBA10CF001'][0]
+    assert len(_times) == len(read_measures_arrays(INPUT)['LBA10CF001'][0])
+
+
+def test_cache_eviction(INPUT, tmp_path) -> None:
+    '''The least recently used cache files are removed'''
+    _settings = {'directory': str(tmp_path / 'cache'), 'max_bytes': 200_000,
+                 'hash_bytes': 4096}
+    load_measures(INPUT, _settings)
+    _first = cache_path(INPUT, _settings)
+    with open(INPUT, 'a') as _file:
+        _file.write('2023-10-07 10:10:02.250,1.0\n')
+    load_measures(INPUT, _settings)
+    assert not os.path.exists(_first)
+    assert os.path.exists(cache_path(INPUT, _settings))
+
+
+@pytest.mark.parametrize("CHUNK_SECONDS", [600, 7, 0.5])
+def test_chunked_store(INPUT, tmp_path, CHUNK_SECONDS) -> None:
+    '''The sets streamed in chunks give the same sets and table'''
+    _store = write_chunked(INPUT, str(tmp_path / 'chunks'),
+                           {'chunk_seconds': CHUNK_SECONDS})
+    _arrays = read_measures_arrays(INPUT)
+    assert list(_store.keys()) == list(_arrays.keys())
+    assert _store.formats == _arrays.formats
+    for _key, (_times, _values) in _arrays.items():
+        assert isinstance(_store[_key][0], np.memmap)
+        assert np.array_equal(_store[_key][0], _times)
+        assert np.array_equal(_store[_key][1], _values)
+        _start, _end = _times[10], _times[10] + 10 * _store.chunk_ns
+        _window = _store.window(_key, _start, _end, margin=0)[0]
+        assert np.array_equal(_window, _times[(_times >= _start) & (_times < _end)])
+    assert synchronized_sets(_store).equals(synchronized_sets(read_measures(INPUT)))
+
+
+@pytest.mark.parametrize("CHOOSE_VALUE", [mean_value, max])
+def test_chunked_store_gap(tmp_path, CHOOSE_VALUE) -> None:
+    '''A gap longer than the chunks gives the table of the sets in memory'''
+    _base = np.datetime64('2023-10-07T08:00:00', 'ns').view(np.int64)
+    _rng = np.random.default_rng(1)
+    _times = {'A': _base + 2_000_000_000 * np.arange(1000, dtype=np.int64),
+              'B': _base + 3_000_000_000 * np.arange(667, dtype=np.int64)}
+    _times['A'] = _times['A'][(_times['A'] < _base + 300 * 10**9)
+                              | (_times['A'] >= _base + 700 * 10**9)]
+    _filename = str(tmp_path / 'gap.csv')
+    with open(_filename, 'w') as _file:
+        for _key, _set_times in _times.items():
+            _file.write(_key + '\n')
+            for _time in _set_times.view('datetime64[ns]').astype('datetime64[s]').astype(str):
+                _file.write(f"{_time.replace('T', ' ')},{_rng.normal():.2f}\n")
+    _store = write_chunked(_filename, str(tmp_path / 'chunks'), {'chunk_seconds': 60})
+    _choice = dict(default_choices, step='2s')
+    _reference = synchronized_sets(read_measures_arrays(_filename), _choice,
+                                   choose_value=CHOOSE_VALUE)
+    _table = synchronized_sets(_store, _choice, choose_value=CHOOSE_VALUE)
+    assert _table.astype(np.float64).equals(_reference.astype(np.float64))
+    if CHOOSE_VALUE is mean_value:
+        _choice = dict(_choice, gaps='empty')
+        assert synchronized_sets(_store, _choice).equals(
+            synchronized_sets(read_measures_arrays(_filename), _choice))
+
+
+@pytest.mark.parametrize("INTERPOLATION", ["pchip", "nearest"])
+def test_chunked_store_interpolation(INPUT, tmp_path, INTERPOLATION) -> None:
+    '''The local interpolations of the windows are the ones of the whole sets'''
+    _store = write_chunked(INPUT, str(tmp_path / 'chunks'), {'chunk_seconds': 7})
+    _choice = dict(default_choices, step='700ms', interpolation=INTERPOLATION)
+    _reference = synchronized_sets(read_measures_arrays(INPUT), _choice)
+    assert synchronized_sets(_store, _choice).equals(_reference)
+    with pytest.raises(ValueError):
+        synchronized_sets(_store, dict(_choice, interpolation='cubic'))
@@ -0,0 +1,98 @@
+import pytest
+
+'''
+Checks of the validation of the input files, launched with the
+command `pytest`
+'''
+
+
+import os
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+LIB_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../lib'))
+DAT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '../../dat'))
+
+import sys
+sys.path.append(LIB_DIR)
+
+from lib.setsManagement import read_measures
+from lib.setsValidation import validate_measures, validation_settings
+from lib.setsReader import read_measures_arrays
+from test_reader import write_wide
+
+
+@pytest.fixture(params=["data.csv", "data_ms.csv"])
+def FILENAME(request):
+    return os.path.abspath(os.path.join(DAT_DIR, request.param))
+
+
+@pytest.fixture
+def INVALID(FILENAME, tmp_path):
+    '''A copy of the data file with invalid rows, and their lines'''
+    _lines = open(FILENAME).read().splitlines()
+    _lines[5] = _lines[5].replace(',', ',abc')
+    _lines[20] = 'x' + _lines[20][1:]
+    _lines[30] = _lines[30] + ',2'
+    _lines[40] = _lines[40].split(',')[0] + ',nan'
+    _filename = str(tmp_path / 'invalid.csv')
+    with open(_filename, 'w') as _file:
+        _file.write('\n'.join(_lines) + '\n')
+    return _filename, [6, 21, 31]
+
+
+def test_valid_file(FILENAME) -> None:
+    '''The data files have no invalid row'''
+    _report = validate_measures(FILENAME)
+    assert _report.valid and not _report.aborted
+    assert _report.rows == {_key: len(_value)
+                            for _key, _value in read_measures(FILENAME).items()}
+
+
+def test_invalid_rows(INVALID) -> None:
+    '''All the invalid rows are reported with their line, as read_measures'''
+    _filename, _expected = INVALID
+    _settings = dict(validation_settings, chunk_bytes=256)
+    _report = validate_measures(_filename, _settings)
+    assert [_error.line for _error in _report.errors] == _expected
+    assert [_error.reason for _error in _report.errors] == ['value', 'date-time', 'value']
+    assert sum(_report.invalid.values()) == 3
+    _errors = []
+    read_measures(_filename, errors=_errors)
+    assert [_error.line for _error in _errors] == _expected
+
+
+def test_error_budget(INVALID) -> None:
+    '''The validation stops once the budget of invalid rows is exceeded'''
+    _filename, _expected = INVALID
+    _report = validate_measures(_filename, {'chunk_bytes': 256, 'max_errors': 1})
+    assert _report.aborted
+    assert len(_report.errors) == 1
+    assert _report.lines < _expected[-1]
+
+
+def test_wide_file(FILENAME, tmp_path) -> None:
+    '''The cells of a wide file are checked column by column'''
+    _wide = str(tmp_path / 'wide.csv')
+    write_wide(_wide, read_measures_arrays(FILENAME), '%Y-%m-%d %H:%M:%S')
+    assert validate_measures(_wide).valid
+    _lines = open(_wide).read().splitlines()
+    _date, _cells = _lines[10].split(',', 1)
+    _lines[10] = _date + ',' + _cells.replace('.', 'x', 1)
+    _lines[20] = '2023-13-07' + _lines[20][10:]
+    with open(_wide, 'w') as _file:
+        _file.write('\n'.join(_lines) + '\n')
+    _report = validate_measures(_wide)
+    assert [(_error.line, _error.reason) for _error in _report.errors] == [
+        (11, 'value'), (21, 'date-time')]
+
+
+def test_malformed_date_time(FILENAME, tmp_path) -> None:
+    '''Only the row with a malformed date-time is reported, at its line'''
+    _lines = open(FILENAME).read().splitlines()
+    _date, _value = _lines[10].split(',')
+    _lines[10] = _date + 'xx,' + _value
+    _filename = str(tmp_path / 'malformed.csv')
+    with open(_filename, 'w') as _file:
+        _file.write('\n'.join(_lines) + '\n')
+    _report = validate_measures(_filename)
+    assert [(_error.line, _error.reason) for _error in _report.errors] == [
+        (11, 'date-time')]
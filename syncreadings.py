@@ -1,17 +1,32 @@
 #!/usr/bin/env python3
 
+import io
+import multiprocessing
 import os
 from tkinter import Tk, font, ttk, Menu, scrolledtext, WORD, DISABLED, NORMAL, END
-from tkinter.filedialog import askopenfilename, asksaveasfilename
+from tkinter.filedialog import askopenfilename, askopenfilenames, asksaveasfilename
 from tkinter import messagebox
 
-from lib.setsManagement import read_measures, get_default_choices
-from lib.setsManagement import synchronized_sets, report_on_sets
+from lib.setsManagement import get_default_choices
+from lib.setsManagement import synchronized_sets, synchronized_tail, report_on_sets
+from lib.setsManagement import unpack_table
+from lib.setsReader import LazySets, TailReader, read_measures_files
+from lib.setsReader import read_measures_arrays, open_measures, detect_compression
+from lib.setsReader import file_layout, reader_settings
+from lib.setsStore import read_cache, write_cache
+from lib.setsValidation import validate_measures
+from lib.measureSet import measure_sets, regularize
+from lib.setsShared import SharedSets
+from lib.setsSteps import steps_report
+from lib.setsStatistics import sets_statistics, parallel_statistics, statistics_report
 import pandas as pd
 
 from lib.my_dialogs import text_message, about_window, user_manual
 from lib.my_dialogs import display_source_plot, display_table
 
+# rows of the table written at once when exporting
+EXPORT_CHUNK_ROWS = 100_000
+
 
 class Application(Tk):
     def __init__(self):
@@ -22,6 +37,9 @@ class Application(Tk):
         self.data_in = {}
         self.data_out = pd.DataFrame()
         self.input_file = ''
+        self.input_files = []
+        self.tail = None
+        self.shared = None
         self.adapt_to_screen_size()
         self.create_menu_bar()
         # self.bind("<Configure>", self.adapt_to_screen_size())
@@ -73,6 +91,16 @@ class Application(Tk):
                               accelerator='CTRL+O',
                               font=self.cmd_font,
                               command=self.load_file)
+        menu_file.add_command(label='Load Several Files',
+                              underline=5,
+                              accelerator='CTRL+E',
+                              font=self.cmd_font,
+                              command=self.load_files)
+        menu_file.add_command(label='Refresh File',
+                              underline=0,
+                              accelerator='CTRL+R',
+                              font=self.cmd_font,
+                              command=self.refresh_file)
         menu_file.add_command(label='Close File',
                               underline=0,
                               accelerator='CTRL+C',
@@ -89,6 +117,8 @@ class Application(Tk):
                              menu=menu_file)
 
         self.bind_all('<Control-o>', lambda _: self.load_file())
+        self.bind_all('<Control-e>', lambda _: self.load_files())
+        self.bind_all('<Control-r>', lambda _: self.refresh_file())
         self.bind_all('<Control-c>', lambda _: self.close_file())
         self.bind_all('<Control-x>', lambda _: self.destroy())
 
@@ -152,8 +182,14 @@ class Application(Tk):
         self.input_file = askopenfilename(title='Select the file to open',
                                           filetypes=[('CSV', '.csv'),
                                                      ('TXT', '.txt'),
+                                                     ('Compressed', '.gz .bz2 .xz'),
                                                      ('All files', '.*')])
-        with open(self.input_file, 'r') as _FILE:
+        # the sets of a previous file or of several files are dropped
+        self.input_files = []
+        self.data_in = {}
+        self.tail = None
+        self.release_shared()
+        with io.TextIOWrapper(open_measures(self.input_file)) as _FILE:
             content = _FILE.read()
 
         self.footer_lbl.configure(
@@ -164,17 +200,122 @@ class Application(Tk):
         self.textbox.insert(END, content)
         self.textbox.config(state=DISABLED)
 
+    def load_files(self):
+        """
+        Load several files at once, as one file per unit and per day: the
+        files are read in parallel and the sets with the same title are
+        merged in time order.
+        """
+        files = askopenfilenames(title='Select the files to open',
+                                 filetypes=[('CSV', '.csv'),
+                                            ('TXT', '.txt'),
+                                            ('Compressed', '.gz .bz2 .xz'),
+                                            ('All files', '.*')])
+        if not files:
+            return
+        reports = [validate_measures(_file) for _file in files]
+        if not all(_report.valid for _report in reports):
+            messagebox.showerror(title='Invalid rows in the input files',
+                                 message='\n'.join(_report.summary(max_rows=3)
+                                                   for _report in reports
+                                                   if not _report.valid))
+            return
+        self.close_file()
+        self.input_files = list(files)
+        self.input_file = self.input_files[0]
+        _arrays = read_measures_files(self.input_files)
+        self.data_in = regularize(measure_sets(_arrays, reader_settings['precision']))
+
+        self.footer_lbl.configure(
+            text=f"{len(self.input_files)} files loaded, {len(self.data_in)} sets")
+        self.textbox.config(state=NORMAL)
+        self.textbox.insert(END, '\n'.join(self.input_files))
+        self.textbox.config(state=DISABLED)
+
+    def refresh_file(self):
+        """
+        Read the rows appended to the input file since it was loaded or
+        last refreshed, the table being only extended with the new rows.
+        """
+        if not self.input_file or self.input_files:
+            messagebox.showwarning(
+                        title='No input file loaded',
+                        message='Load first a single input file.')
+            return
+        elif detect_compression(self.input_file):
+            messagebox.showwarning(
+                        title='Compressed input file',
+                        message='A compressed file cannot be refreshed.')
+            return
+        elif file_layout(self.input_file) == 'wide':
+            messagebox.showwarning(
+                        title='Wide input file',
+                        message='A file with a column per set cannot be refreshed.')
+            return
+        if self.tail is None:
+            self.tail = TailReader(self.input_file)
+        _new = self.tail.update()
+        self.data_in = self.tail.measures
+        self.release_shared()
+        _rows = sum(len(_times) for _times, _ in _new.values())
+        if not self.data_out.empty:
+            self.data_out = synchronized_tail(self.data_out, self.data_in, self.settings)
+            self.textbox.config(state=NORMAL)
+            self.textbox.delete('1.0', END)
+            self.textbox.insert(END, unpack_table(self.data_out).to_string(index=True))
+            self.textbox.config(state=DISABLED)
+        self.footer_lbl.configure(
+            text=f"File '{os.path.basename(self.input_file)}' refreshed, {_rows} new rows")
+
+    def read_input(self) -> bool:
+        """
+        Take the sets from the cache of the input file if it exists, else
+        index the file to load the sets only when they are used. A
+        compressed file or a wide file (a column per set) cannot be
+        indexed, it is read in a single stream.
+        A file which is not in the cache is first validated, the invalid
+        rows being shown in a single message and the file not loaded.
+        The sets with a constant step are kept as ``RegularSeries``.
+        """
+        self.release_shared()
+        self.data_in = read_cache(self.input_file)
+        if self.data_in is not None:
+            self.data_in = regularize(measure_sets(self.data_in,
+                                                   reader_settings['precision']))
+        else:
+            self.data_in = {}
+            report = validate_measures(self.input_file)
+            if not report.valid:
+                messagebox.showerror(title='Invalid rows in the input file',
+                                     message=report.summary())
+                return False
+            if (detect_compression(self.input_file)
+                    or file_layout(self.input_file) == 'wide'):
+                _arrays = read_measures_arrays(self.input_file)
+                self.data_in = regularize(measure_sets(_arrays, reader_settings['precision']))
+                write_cache(self.input_file, self.data_in)
+            else:
+                self.data_in = LazySets(self.input_file)
+        return True
+
     def sets_analysis(self):
         if not self.input_file:
             messagebox.showwarning(
                         title='No input file loaded',
                         message='Load first an input file.')
             return
-        elif not self.data_in:
-            self.data_in = read_measures(self.input_file)
+        elif not self.data_in and not self.read_input():
+            return
         details = report_on_sets(self.data_in)
+        if isinstance(self.data_in, LazySets):
+            # the statistics parse all the sets, kept for the table
+            _statistics = sets_statistics(self.data_in)
+        else:
+            # the sets are read by the workers in the shared segment
+            _statistics = parallel_statistics(self.shared_sets())
+        details += '\n\n' + statistics_report(_statistics)
         text_message(self, text=details, title='Data Sets Details',
-                     width=60, height=12)
+                     width=100, height=20)
 
     def format_datasets(self):
         if not self.input_file:
@@ -182,12 +323,24 @@ class Application(Tk):
                         title='No input file loaded',
                         message='Load first an input file.')
             return
-        elif not self.data_in:
-            self.data_in = read_measures(self.input_file)
+        elif not self.data_in and not self.read_input():
+            return
+        # the gaps between regular runs are handled, not the other deviations
+        _irregular = [_report.summary() for _report in steps_report(self.data_in).values()
+                      if not _report.gaps_only]
+        if _irregular:
+            messagebox.showwarning(title='Time steps not constant',
+                                   message='\n'.join(_irregular))
         self.data_out = synchronized_sets(self.data_in, self.settings)
+        if isinstance(self.data_in, LazySets):
+            # all the sets are now parsed, keep them for the next opening
+            write_cache(self.input_file, self.data_in)
+            self.data_in = regularize(measure_sets(self.data_in,
+                                                   reader_settings['precision']))
+            self.release_shared()
         self.textbox.config(state=NORMAL)
         self.textbox.delete('1.0', END)
-        self.textbox.insert(END, self.data_out.to_string(index=True))
+        self.textbox.insert(END, unpack_table(self.data_out).to_string(index=True))
         self.textbox.config(state=DISABLED)
         self.footer_lbl.configure(
             text=f"File '{os.path.basename(self.input_file)}' loaded, data tabulated")
@@ -206,7 +359,13 @@ class Application(Tk):
                 title='Enter file name for saving',
                 defaultextension='*.csv',
                 filetypes=[('CSV', '*.csv')])
-            self.data_out.to_csv(_FILE)
+            # the values stored with a smaller precision are given back
+            # in float64 chunk by chunk
+            for _first in range(0, len(self.data_out), EXPORT_CHUNK_ROWS):
+                _chunk = self.data_out.iloc[_first:_first + EXPORT_CHUNK_ROWS]
+                _chunk.attrs = self.data_out.attrs
+                unpack_table(_chunk).to_csv(_FILE, mode='w' if _first == 0 else 'a',
+                                            header=_first == 0)
             self.footer_lbl.configure(
                 text=f"File '{os.path.basename(_FILE)}' saved")
 
@@ -224,7 +383,7 @@ class Application(Tk):
                         title='Enter file name for saving',
                         defaultextension='*.xlsx',
                         filetypes=[('XLSX', '*.xlsx')])
-            self.data_out.to_excel(_FILE)
+            unpack_table(self.data_out).to_excel(_FILE)
             self.footer_lbl.configure(
                 text=f"File '{os.path.basename(_FILE)}' saved")
 
@@ -235,18 +394,42 @@ class Application(Tk):
         self.data_out = pd.DataFrame()
         self.sets_char = {}
         self.input_file = ''
+        self.input_files = []
+        self.tail = None
+        self.release_shared()
         self.textbox.config(state=NORMAL)
         self.textbox.delete('1.0', END)
         self.textbox.config(state=DISABLED)
 
+    def shared_sets(self) -> SharedSets:
+        """
+        Sets of the input placed in shared memory, to be given to worker
+        processes without copy. The segment is created on the first call
+        and removed when the input changes or the application is closed.
+        """
+        if self.shared is None:
+            self.shared = SharedSets.create(self.data_in)
+        return self.shared
+
+    def release_shared(self):
+        """Remove the shared memory segment of the previous input."""
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
+
+    def destroy(self):
+        self.release_shared()
+        Tk.destroy(self)
+
     def plot_source(self):
         """Plot on an independent window the graph of the source measures"""
         if not self.input_file:
             messagebox.showwarning(
                         title='No input file loaded',
                         message='Load first an input file.')
-        elif not self.data_in:
-            self.data_in = read_measures(self.input_file)
+            return
+        elif not self.data_in and not self.read_input():
+            return
         display_source_plot(self, self.data_in, title='Source measures.')
 
     def plot_table(self):
@@ -260,7 +443,7 @@ class Application(Tk):
                 title='Data sets no re-formatted',
                 message='Re-format first the sets of data into a table.')
         else:
-            display_table(self, self.data_out, title='Synchronized measures.')
+            display_table(self, unpack_table(self.data_out), title='Synchronized measures.')
     
     def plot_compare(self):
         """Plot the source measures with their synchronized versions."""
@@ -273,7 +456,7 @@ class Application(Tk):
                 title='Data sets no re-formatted',
                 message='Re-format first the sets of data into a table.')
         else:
-            display_table(self, self.data_out, title='Synchronized measures.')
+            display_table(self, unpack_table(self.data_out), title='Synchronized measures.')
 
     def about_window(self):
         """Window giving general information on the application."""
@@ -290,5 +473,8 @@ class Application(Tk):
                     html_file='./lib/html/help.html')
 
 if __name__ == "__main__":
+    # the workers of the parallel readers, in the executable built by
+    # PyInstaller, run their task instead of starting the application
+    multiprocessing.freeze_support()
     application = Application()
     application.mainloop()